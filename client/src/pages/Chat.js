@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { useLocation } from 'react-router-dom';
-import api from '../services/api';
+import api, { batch } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import { Container, Row, Col, Card, Form, Button, ListGroup, Spinner, Alert } from 'react-bootstrap';
 
@@ -13,21 +13,25 @@ const Chat = () => {
   const [hasMore, setHasMore] = useState(true);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
+  const [contactSearch, setContactSearch] = useState('');
+  const [usersCursor, setUsersCursor] = useState(null);
   const messagesEndRef = useRef(null);
   const { user } = useAuth();
   const location = useLocation();
 
-  const fetchChatUsers = useCallback(async () => {
+  const fetchChatUsers = useCallback(async (cursor = null) => {
     try {
       setLoading(true);
-      // Get all users for chat (farmers for buyers, buyers for farmers)
-      const allUsersResponse = await api.get('/api/users');
-      const filteredUsers = allUsersResponse.data.filter(u => 
-        u.id !== user.id && 
-        ((user.user_type === 'buyer' && u.user_type === 'farmer') || 
-         (user.user_type === 'farmer' && u.user_type === 'buyer'))
-      );
-      setUsers(filteredUsers);
+      // Page through the directory (farmers for buyers, buyers for farmers)
+      const response = await api.get('/api/users', {
+        params: {
+          type: user.user_type === 'farmer' ? 'buyer' : 'farmer',
+          q: contactSearch.trim() || undefined,
+          cursor: cursor || undefined
+        }
+      });
+      setUsers(prev => (cursor ? [...prev, ...response.data.users] : response.data.users));
+      setUsersCursor(response.data.next_cursor);
       setError('');
     } catch (error) {
       console.error('Error fetching chat users:', error);
@@ -35,16 +39,19 @@ const Chat = () => {
       try {
         const response = await api.get('/api/chat/users');
         setUsers(response.data);
+        setUsersCursor(null);
       } catch (fallbackError) {
         setError('Failed to load chat users');
       }
     } finally {
       setLoading(false);
     }
-  }, [user]);
+  }, [user, contactSearch]);
 
   useEffect(() => {
-    fetchChatUsers();
+    // Debounce so typing a search doesn't fire a request per keystroke
+    const timer = setTimeout(() => fetchChatUsers(), 300);
+    return () => clearTimeout(timer);
   }, [fetchChatUsers]);
 
   useEffect(() => {
@@ -70,8 +77,17 @@ const Chat = () => {
   const fetchMessages = async (userId, pageNum = 1) => {
     try {
       setLoading(true);
-      const response = await api.get(`/api/chat/${userId}?page=${pageNum}`);
-      const newMessages = response.data.messages.reverse();
+      // The first page also marks the conversation read, in the same round
+      // trip; messages are fetched first, so unread ones still show as such
+      const requests = [{ method: 'GET', path: `/api/chat/${userId}?page=${pageNum}` }];
+      if (pageNum === 1) {
+        requests.push({ method: 'POST', path: '/api/chat/mark-read', body: { sender_id: userId } });
+      }
+      const [response] = await batch(requests);
+      if (response.status !== 200) {
+        throw new Error(`Loading messages failed with status ${response.status}`);
+      }
+      const newMessages = response.body.messages.reverse();
       
       if (pageNum === 1) {
         setMessages(newMessages);
@@ -80,13 +96,8 @@ const Chat = () => {
       }
       
       setPage(pageNum);
-      setHasMore(response.data.pages > pageNum);
+      setHasMore(response.body.pages > pageNum);
       setError('');
-      
-      // Mark messages as read
-      if (newMessages.some(m => !m.read && m.sender_id === userId)) {
-        await api.post('/api/chat/mark-read', { sender_id: userId });
-      }
     } catch (error) {
       console.error('Error fetching messages:', error);
       setError('Failed to load messages');
@@ -153,7 +164,14 @@ const Chat = () => {
             {/* Users List - Left Sidebar */}
             <Col md={4} className="border-end bg-light">
               <div className="p-3 border-bottom bg-white">
-                <h5 className="mb-0 text-dark">Contacts</h5>
+                <h5 className="mb-2 text-dark">Contacts</h5>
+                <Form.Control
+                  size="sm"
+                  type="search"
+                  placeholder="Search by name or farm"
+                  value={contactSearch}
+                  onChange={(e) => setContactSearch(e.target.value)}
+                />
               </div>
               
               <div style={{ height: '548px', overflowY: 'auto' }}>
@@ -202,6 +220,18 @@ const Chat = () => {
                         </div>
                       </ListGroup.Item>
                     ))}
+                    {usersCursor && (
+                      <ListGroup.Item className="border-0 text-center">
+                        <Button
+                          variant="link"
+                          size="sm"
+                          disabled={loading}
+                          onClick={() => fetchChatUsers(usersCursor)}
+                        >
+                          Load more contacts
+                        </Button>
+                      </ListGroup.Item>
+                    )}
                   </ListGroup>
                 )}
               </div>
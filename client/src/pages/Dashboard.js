@@ -2,7 +2,7 @@
 import React, { useState, useEffect, useCallback } from 'react';
 import { Container, Row, Col, Card, Button, Tab, Tabs, Table, Form, Alert, Spinner, Modal } from 'react-bootstrap';
 import { useAuth } from '../context/AuthContext';
-import api from '../services/api';
+import api, { batch } from '../services/api';
 
 const Dashboard = () => {
   const { user } = useAuth();
@@ -45,13 +45,40 @@ const Dashboard = () => {
     }
   }, []);
 
+  // Farmers get their products and orders in one round trip
+  const fetchDashboard = useCallback(async () => {
+    if (user?.user_type !== 'farmer') {
+      return fetchOrders();
+    }
+    try {
+      const [productsResponse, ordersResponse] = await batch([
+        { method: 'GET', path: '/api/products?farmer_id=' + user.id },
+        { method: 'GET', path: '/api/orders' }
+      ], { parallel: true });
+      if (productsResponse.status === 200) {
+        setProducts(productsResponse.body);
+      } else {
+        setError('Failed to load products');
+      }
+      if (ordersResponse.status === 200) {
+        setOrders(ordersResponse.body);
+      } else {
+        setError('Failed to load orders');
+      }
+    } catch (error) {
+      console.error('Error fetching dashboard:', error);
+      setError('Failed to load dashboard');
+    } finally {
+      setLoading(false);
+    }
+  }, [user, fetchOrders]);
+
   useEffect(() => {
     if (user) {
       setLoading(true);
-      fetchProducts();
-      fetchOrders();
+      fetchDashboard();
     }
-  }, [user, fetchProducts, fetchOrders]);
+  }, [user, fetchDashboard]);
 
   const handleAddProduct = async (e) => {
     e.preventDefault();
@@ -24,4 +24,12 @@ api.interceptors.request.use(
   }
 );
 
-export default api;
\ No newline at end of file
+// Collapse several API calls into one round trip.
+// `requests` is a list of { method, path, body }; read-only batches can set
+// `parallel` to let the server run them concurrently.
+export const batch = async (requests, { parallel = false } = {}) => {
+  const response = await api.post('/api/batch', { requests, parallel });
+  return response.data.responses;
+};
+
+export default api;
@@ -0,0 +1,5 @@
+# ASGI entry point: `SERVER_MODE=asgi gunicorn -c gunicorn.conf.py`
+from app import create_app
+from asgi_app import AsgiApp
+
+app = AsgiApp(create_app({'LOAD_MIGRATIONS': False}))
@@ -0,0 +1,289 @@
+# asgi_app.py
+import asyncio
+import contextvars
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import request_started
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+
+from app import start_background_workers
+from async_db import AsyncDatabase
+from async_views import ASYNC_VIEWS
+
+class ClientDisconnected(Exception):
+    pass
+
+
+def build_environ(scope, body):
+    """
+    WSGI environ for an ASGI http scope; body is the wsgi.input stream
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # Read to EOF rather than trusting Content-Length (chunked uploads)
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def read_body(receive, limit):
+    """
+    The whole request body, or None once it exceeds limit bytes
+    """
+    chunks, size, more = [], 0, True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ClientDisconnected()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > limit:
+            return None
+        chunks.append(chunk)
+        more = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+class ReceiveStream(io.RawIOBase):
+    """
+    wsgi.input for views running in the thread pool: pulls body chunks from
+    the ASGI receive channel as the view reads, so uploads aren't buffered
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ClientDisconnected()
+            self._buffer = message.get('body', b'')
+            self._more = message.get('more_body', False)
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+async def _too_large(**kwargs):
+    raise RequestEntityTooLarge()
+
+
+class AsgiApp:
+    """
+    Serves the Flask app over ASGI (see asgi.py). Endpoints with a coroutine
+    in async_views.ASYNC_VIEWS run on the event loop, so a request waiting
+    on the database holds a socket and a coroutine rather than a worker.
+    They go through the app's own request context, before/after_request
+    hooks (rate limits, CORS, compression) and error handlers, so responses
+    match WSGI mode; the rate limit check and compression, which can block
+    or burn CPU, are handed to the thread pool. Every other endpoint runs
+    unchanged in a pool of ASGI_THREADS threads, with request and response
+    bodies streamed, as do streamed response bodies from the async views.
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.async_db = flask_app.extensions['async_db'] = AsyncDatabase(flask_app)
+        self.views = {
+            endpoint: view for endpoint, view in ASYNC_VIEWS.items()
+            if endpoint in flask_app.view_functions
+        }
+        self.limiter = flask_app.extensions['ratelimiter']
+        self.compressor = flask_app.extensions['compressor']
+        self.threads = flask_app.config['ASGI_THREADS']
+        self.max_body = flask_app.config['ASGI_MAX_BODY_BYTES']
+        self._executor = None
+
+    @property
+    def executor(self):
+        # Created on first use so preloaded apps start their threads per worker
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix='asgi-wsgi')
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            try:
+                await self._http(scope, receive, send)
+            except ClientDisconnected:
+                pass
+        elif scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'websocket':
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1000})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Also run by gunicorn's post_worker_init; starting twice is a no-op
+                start_background_workers(self.flask_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.async_db.dispose()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, io.BufferedReader(ReceiveStream(receive, loop)))
+        ctx = self.flask_app.request_context(environ)
+        view = self.views.get(self._endpoint(ctx))
+        if view is None:
+            await loop.run_in_executor(self.executor, self._call_wsgi, self.flask_app, environ, send, loop)
+            return
+
+        body = await read_body(receive, self.max_body)
+        if body is None:
+            view = _too_large
+        environ['wsgi.input'] = io.BytesIO(body or b'')
+        environ['smartfarm.compress_off_loop'] = self.compressor.enabled
+        response = await self._dispatch(ctx, view)
+        if response.is_streamed:
+            # A generator body may block between chunks, so it's iterated
+            # in the thread pool; a response is a WSGI app of its own
+            await loop.run_in_executor(self.executor, self._call_wsgi, response, environ, send, loop)
+            return
+
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        try:
+            await send(self._start_message(status, headers))
+            for chunk in app_iter:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    @staticmethod
+    def _endpoint(ctx):
+        if ctx.url_adapter is None:
+            return None
+        try:
+            rule, _ = ctx.url_adapter.match(return_rule=True)
+        except HTTPException:
+            return None
+        if ctx.request.method == 'OPTIONS' and getattr(rule, 'provide_automatic_options', False):
+            # Flask answers these itself (CORS preflights)
+            return None
+        return rule.endpoint
+
+    async def _dispatch(self, ctx, view):
+        # Flask.wsgi_app and full_dispatch_request, awaiting the view. The
+        # request context lives in contextvars, so it stays local to this
+        # request's task across awaits
+        app = self.flask_app
+        error = None
+        ctx.push()
+        try:
+            try:
+                try:
+                    request_started.send(app)
+                    rv = None
+                    if self.limiter.store is not None:
+                        # RateLimiter.check is the first before_request hook,
+                        # so this keeps WSGI's order; it then skips itself
+                        rv = await self._in_executor(self.limiter.check_request)
+                        ctx.request.environ['smartfarm.ratelimit_checked'] = True
+                    if rv is None:
+                        rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**ctx.request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+                if self.compressor.enabled:
+                    response = await self._in_executor(self.compressor.compress_response, response)
+                return response
+            except Exception as e:
+                error = e
+                return app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+    def _in_executor(self, f, *args):
+        # Thread pool threads don't inherit contextvars, so f runs in a copy
+        # of this task's context to see the request
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(self.executor, context.run, f, *args)
+
+    def _call_wsgi(self, wsgi_app, environ, send, loop):
+        # Runs in the thread pool; each ASGI send is handed back to the loop
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        app_iter = wsgi_app(environ, start_response)
+        try:
+            sent_start = False
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                if not sent_start:
+                    send_sync(self._start_message(*started))
+                    sent_start = True
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not sent_start:
+                send_sync(self._start_message(*started))
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    @staticmethod
+    def _start_message(status, headers):
+        return {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        }
@@ -0,0 +1,93 @@
+# async_db.py
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import configure_mappers
+
+from models import db
+
+# Backend -> asyncio driver used for it in ASGI mode
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """
+    The same database as url, reached through its asyncio driver
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend} databases')
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == 'postgresql' and 'sslmode' in url.query:
+        # asyncpg spells libpq's sslmode as ssl
+        url = url.difference_update_query(['sslmode']).update_query_dict({'ssl': url.query['sslmode']})
+    return url
+
+
+def is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:')
+        or url.database.startswith('file::memory:')
+        or url.query.get('mode') == 'memory'
+    )
+
+
+class AsyncDatabase:
+    """
+    Async engine and sessions for the views in async_views.py. The engine
+    is created on first use, inside the worker's event loop, with its own
+    pool of ASYNC_DB_POOL_SIZE (+ ASYNC_DB_MAX_OVERFLOW) connections; the
+    sync pool keeps serving the Flask views run in the thread pool.
+    """
+
+    def __init__(self, app=None):
+        self._engine = None
+        self._sessionmaker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Each in-memory SQLite connection is a database of its own, so the
+        # async engine would never see the sync engine's tables
+        if is_memory_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+            raise ValueError('ASGI mode needs a file or server database, not in-memory SQLite')
+        self.app = app
+        # The async views name backref attributes (Product.farmer) in loader
+        # options, which only exist once the mappers are configured; sync
+        # queries do that on first use, but nothing may have run one yet
+        configure_mappers()
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            with self.app.app_context():
+                # Flask-SQLAlchemy has already resolved relative SQLite paths
+                url = db.engine.url
+
+            options = {}
+            if url.get_backend_name() != 'sqlite':
+                options.update(
+                    pool_size=self.app.config['ASYNC_DB_POOL_SIZE'],
+                    max_overflow=self.app.config['ASYNC_DB_MAX_OVERFLOW'],
+                    pool_timeout=self.app.config['ASYNC_DB_POOL_TIMEOUT']
+                )
+            engine = create_async_engine(async_url(url), **options)
+            if self.app.config.get('SLOW_QUERY_LOG_ENABLED', True) and 'slow_query_log' in self.app.extensions:
+                self.app.extensions['slow_query_log'].watch(engine.sync_engine)
+
+            self._sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+            self._engine = engine
+        return self._engine
+
+    def session(self):
+        self.engine
+        return self._sessionmaker()
+
+    async def dispose(self):
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
@@ -0,0 +1,186 @@
+# async_views.py
+from functools import wraps
+
+from flask import abort, current_app, jsonify, request
+from sqlalchemy.orm import joinedload
+
+from models import User, Product, Order, ChatMessage
+from chat_search import search_results, search_statement
+from pagination import InvalidCursor
+from read_models import ProductListing, products_query
+from routes import (chat_contact_statements, chat_message_dict, chat_page, chat_page_response, chat_page_statements,
+                    chat_search_response, chat_users_response, confirm_mpesa_payment, mark_read_statement,
+                    mpesa_order_id, parse_chat_search, parse_product_filters, product_detail,
+                    product_listing_response, token_user_id)
+
+# Flask endpoint -> coroutine serving it in ASGI mode (see asgi_app.py). Each
+# mirrors its view in routes.py, sharing the argument parsing and response
+# shaping and statements, but waits on the async engine instead of holding
+# a thread
+ASYNC_VIEWS = {}
+
+
+def async_view(endpoint):
+    def register(f):
+        ASYNC_VIEWS[endpoint] = f
+        return f
+    return register
+
+
+def session():
+    return current_app.extensions['async_db'].session()
+
+
+# Async counterpart of routes.token_required
+def token_required(f):
+    @wraps(f)
+    async def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+
+        try:
+            async with session() as s:
+                current_user = await s.get(User, token_user_id(token))
+        except Exception:
+            return jsonify({'message': 'Token is invalid!'}), 401
+
+        return await f(current_user, *args, **kwargs)
+
+    return decorated
+
+
+# Get all products with filtering
+@async_view('api.get_products')
+async def get_products():
+    filters, error = parse_product_filters()
+    if error is not None:
+        return error
+
+    async with session() as s:
+        rows = await s.execute(
+            products_query(filters['category'], filters['farmer_id'], filters['search'], filters['prefixes'])
+        )
+    return product_listing_response(ProductListing.from_rows(rows), filters)
+
+
+# Get a specific product
+@async_view('api.get_product')
+async def get_product(product_id):
+    async with session() as s:
+        product = await s.get(Product, product_id, options=[joinedload(Product.farmer)])
+    if product is None:
+        abort(404)
+
+    return jsonify(product_detail(product)), 200
+
+
+# MPesa callback endpoint
+@async_view('api.mpesa_callback')
+async def mpesa_callback():
+    data = request.get_json()
+
+    try:
+        callback_metadata = data['Body']['stkCallback']['CallbackMetadata']['Item']
+        order_id = mpesa_order_id(callback_metadata)
+
+        async with session() as s:
+            order = await s.get(Order, order_id)
+            if not order:
+                return jsonify({'message': 'Order not found'}), 404
+
+            event = confirm_mpesa_payment(order, callback_metadata, s)
+            await s.commit()
+        if event is not None:
+            current_app.extensions['outbox'].notify()
+
+        return jsonify({'message': 'Callback processed successfully'}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error processing MPesa callback: {e}")
+        return jsonify({'message': 'Error processing callback'}), 400
+
+
+# Search the current user's conversations
+@async_view('api.search_chat_messages')
+@token_required
+async def search_chat_messages(current_user):
+    search, error = parse_chat_search()
+    if error is not None:
+        return error
+
+    try:
+        statement = search_statement(
+            current_app.extensions['async_db'].engine.dialect.name, current_user.id,
+            search['q'], search['other_user_id'], search['after'], search['limit'] + 1
+        )
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+
+    rows = []
+    if statement is not None:
+        async with session() as s:
+            rows = (await s.execute(*statement)).mappings().all()
+    return chat_search_response(search_results(rows), search)
+
+
+# Get user list for chat
+@async_view('api.get_chat_users')
+@token_required
+async def get_chat_users(current_user):
+    ordered, message_senders = chat_contact_statements(current_user)
+    async with session() as s:
+        ordered = (await s.scalars(ordered)).all()
+        message_senders = (await s.scalars(message_senders)).all()
+
+    return chat_users_response(ordered, message_senders)
+
+
+# Get chat messages between users
+@async_view('api.get_chat_messages')
+@token_required
+async def get_chat_messages(current_user, other_user_id):
+    page, limit, offset = chat_page()
+    messages, total = chat_page_statements(current_user.id, other_user_id, limit, offset)
+    async with session() as s:
+        messages = (await s.scalars(messages)).all()
+        total = await s.scalar(total)
+
+    return chat_page_response(messages, total, page, limit)
+
+
+# Send a chat message
+@async_view('api.send_chat_message')
+@token_required
+async def send_chat_message(current_user, receiver_id):
+    data = request.get_json()
+
+    async with session() as s:
+        # Check if receiver exists
+        receiver = await s.get(User, receiver_id)
+        if not receiver:
+            return jsonify({'message': 'Receiver not found'}), 404
+
+        chat_message = ChatMessage(
+            sender_id=current_user.id,
+            receiver_id=receiver_id,
+            message=data['message']
+        )
+        s.add(chat_message)
+        await s.commit()
+
+    return jsonify(chat_message_dict(chat_message)), 201
+
+
+# Mark messages as read
+@async_view('api.mark_messages_as_read')
+@token_required
+async def mark_messages_as_read(current_user):
+    data = request.get_json()
+    sender_id = data.get('sender_id')
+
+    # Mark all unread messages from this sender as read
+    async with session() as s:
+        await s.execute(mark_read_statement(current_user.id, sender_id))
+        await s.commit()
+
+    return jsonify({'message': 'Messages marked as read'}), 200
@@ -0,0 +1,102 @@
+# batch.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g
+
+from models import db
+
+BATCH_PATH = '/api/batch'
+ALLOWED_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+_executor = None
+
+
+class InvalidSubrequest(ValueError):
+    pass
+
+
+def _get_executor(workers):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+    return _executor
+
+
+def validate_subrequests(subrequests, max_requests):
+    """
+    Check the shape of a batch payload, returning the normalized sub-requests
+    """
+    if not isinstance(subrequests, list) or not subrequests:
+        raise InvalidSubrequest('requests must be a non-empty list')
+    if len(subrequests) > max_requests:
+        raise InvalidSubrequest(f'A batch may contain at most {max_requests} requests')
+
+    normalized = []
+    for index, sub in enumerate(subrequests):
+        if not isinstance(sub, dict):
+            raise InvalidSubrequest(f'Request {index} must be an object')
+        method = str(sub.get('method', 'GET')).upper()
+        path = sub.get('path')
+        if method not in ALLOWED_METHODS:
+            raise InvalidSubrequest(f'Request {index} has unsupported method {method}')
+        if not isinstance(path, str) or not path.startswith('/api/'):
+            raise InvalidSubrequest(f'Request {index} must target an /api/ path')
+        if path.split('?', 1)[0].rstrip('/') == BATCH_PATH:
+            raise InvalidSubrequest('Batches cannot be nested')
+        normalized.append({'method': method, 'path': path, 'body': sub.get('body')})
+    return normalized
+
+
+def _dispatch(app, sub, headers):
+    # The app context (and so g.batch_user) is inherited from the caller;
+    # each sub-request only gets its own request context
+    started = time.perf_counter()
+    kwargs = {'method': sub['method'], 'headers': headers}
+    if sub['body'] is not None:
+        kwargs['json'] = sub['body']
+
+    try:
+        with app.test_request_context(sub['path'], **kwargs) as ctx:
+            ctx.request.environ['smartfarm.batch'] = True
+            response = app.full_dispatch_request()
+    except Exception:
+        app.logger.exception('Batch sub-request %s %s failed', sub['method'], sub['path'])
+        status, body = 500, {'message': 'Internal server error'}
+    else:
+        status = response.status_code
+        body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+
+    return {
+        'status': status,
+        'body': body,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+
+def _dispatch_in_thread(app, user, sub, headers):
+    with app.app_context():
+        # Attach the already-authenticated user to this thread's session
+        # without another lookup
+        g.batch_user = db.session.merge(user, load=False)
+        return _dispatch(app, sub, headers)
+
+
+def run_batch(app, user, subrequests, headers, parallel=False, workers=4):
+    """
+    Dispatch sub-requests in process as the given user. Read-only batches may
+    fan out over a thread pool; anything with a write runs in order.
+    """
+    g.batch_user = user
+    try:
+        read_only = all(sub['method'] == 'GET' for sub in subrequests)
+        if parallel and read_only and workers > 1 and len(subrequests) > 1:
+            executor = _get_executor(workers)
+            futures = [
+                executor.submit(_dispatch_in_thread, app, user, sub, headers)
+                for sub in subrequests
+            ]
+            return [future.result() for future in futures]
+        return [_dispatch(app, sub, headers) for sub in subrequests]
+    finally:
+        g.pop('batch_user', None)
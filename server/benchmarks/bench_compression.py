@@ -0,0 +1,65 @@
+"""
+Bytes on the wire and CPU cost of compressing a catalog (GET /api/products)
+payload at different gzip levels and brotli qualities.
+
+    python benchmarks/bench_compression.py [products]
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compression import brotli, compress
+
+CATEGORIES = ['vegetables', 'fruits', 'grains', 'dairy']
+NAMES = ['Fresh Tomatoes', 'Organic Carrots', 'Sweet Bananas', 'Fresh Avocados', 'Green Spinach',
+         'Red Apples', 'White Maize', 'Fresh Milk', 'Green Cabbage', 'Brown Beans']
+
+
+def catalog_payload(count):
+    return json.dumps([{
+        'id': i,
+        'name': NAMES[i % len(NAMES)],
+        'description': f'Fresh, high-quality {NAMES[i % len(NAMES)].lower()} directly from our farm. '
+                       'Grown with care using sustainable farming practices.',
+        'price': float(20 + (i * 7) % 100),
+        'category': CATEGORIES[i % len(CATEGORIES)],
+        'quantity': 50 + (i * 13) % 150,
+        'image_url': f'/api/images/{i:064x}_md.jpg',
+        'farmer_id': i % 40,
+        'farmer_name': f'farmer{i % 40}',
+        'farm_name': f'Farm {i % 40}'
+    } for i in range(count)]).encode()
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    payload = catalog_payload(count)
+    print(f'catalog of {count} products: {len(payload):,} bytes uncompressed')
+
+    settings = [('gzip', level) for level in (1, 5, 6, 9)]
+    if brotli is not None:
+        settings += [('br', quality) for quality in (1, 4, 6, 11)]
+    else:
+        print('(brotli not installed; skipping br)')
+
+    for encoding, level in settings:
+        kwargs = {'gzip_level': level} if encoding == 'gzip' else {'brotli_quality': level}
+        body, seconds = timed(lambda: compress(payload, encoding, **kwargs), repeat=5)
+        print(f'{encoding:>4} {level:>2}: {len(body):>9,} bytes ({len(body) / len(payload):6.1%})'
+              f'  {seconds * 1000:8.2f} ms  {len(payload) / seconds / 1e6:8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Per-check cost of the rate limiter bucket stores.
+
+    python benchmarks/bench_ratelimit.py [iterations]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import MemoryBucketStore, MmapBucketStore
+
+
+def bench(store, iterations, keys=1000):
+    names = [f'get_products:user:{i}' for i in range(keys)]
+    acquire = store.acquire
+    started = time.perf_counter()
+    for i in range(iterations):
+        acquire(names[i % keys], 30, 10)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    print(f'memory: {bench(MemoryBucketStore(), iterations):8.0f} ns/check')
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MmapBucketStore(os.path.join(tmp, 'ratelimit.bin'))
+        print(f'mmap:   {bench(store, iterations):8.0f} ns/check')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Peak RSS and rows/sec of the product and review listings, loaded through the
+ORM (as the routes used to) versus the Core read models in read_models.py.
+Each variant runs in a fresh interpreter against the same seeded SQLite file
+so max RSS isn't polluted by the other.
+
+    python benchmarks/bench_read_models.py [rows]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FARMERS = 200
+
+SEED = '''
+import datetime
+from app import create_app
+from models import db, User, Product, Review
+
+rows = {rows}
+app = create_app({{'LOAD_MIGRATIONS': False, 'RATELIMIT_ENABLED': False}})
+with app.app_context():
+    db.create_all()
+    now = datetime.datetime.utcnow()
+    db.session.execute(db.insert(User), [
+        {{'id': i, 'username': f'user{{i}}', 'email': f'user{{i}}@example.com', 'password_hash': 'x',
+          'user_type': 'farmer' if i <= {farmers} else 'buyer', 'farm_name': f'Farm {{i}}'}}
+        for i in range(1, {farmers} * 2 + 1)
+    ])
+    db.session.execute(db.insert(Product), [
+        {{'id': i, 'name': f'Product {{i}}', 'description': 'Fresh produce ' * 4, 'price': 10.0 + i % 90,
+          'category': 'Vegetables', 'quantity': i % 500, 'farmer_id': i % {farmers} + 1}}
+        for i in range(1, rows + 1)
+    ])
+    db.session.execute(db.insert(Review), [
+        {{'id': i, 'user_id': {farmers} + i % {farmers} + 1, 'product_id': i, 'rating': i % 5 + 1,
+          'comment': 'Good quality', 'created_at': now}}
+        for i in range(1, rows + 1)
+    ])
+    db.session.commit()
+'''
+
+CHILD = '''
+import resource, time
+from app import create_app
+from models import Product, Review
+from read_models import load_products, load_reviews
+
+def orm_products():
+    return [{{
+        'id': p.id, 'name': p.name, 'description': p.description, 'price': p.price,
+        'category': p.category, 'quantity': p.quantity, 'image_url': p.image_url,
+        'farmer_id': p.farmer_id, 'farmer_name': p.farmer.username, 'farm_name': p.farmer.farm_name
+    }} for p in Product.query.all()]
+
+def orm_reviews():
+    return [{{
+        'id': r.id, 'user_id': r.user_id, 'product_id': r.product_id, 'rating': r.rating,
+        'comment': r.comment, 'created_at': r.created_at.isoformat(), 'username': r.user.username
+    }} for r in Review.query.all()]
+
+def core_products():
+    return [p.to_dict() for p in load_products()]
+
+def core_reviews():
+    return [r.to_dict() for r in load_reviews()]
+
+app = create_app({{'LOAD_MIGRATIONS': False, 'SLOW_QUERY_LOG_ENABLED': False}})
+with app.app_context():
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    count = len({func}())
+    elapsed = time.perf_counter() - started
+    print(count, elapsed, baseline, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+VARIANTS = (
+    ('products', 'ORM', 'orm_products'),
+    ('products', 'read model', 'core_products'),
+    ('reviews', 'ORM', 'orm_reviews'),
+    ('reviews', 'read model', 'core_reviews'),
+)
+
+
+def run(code, env):
+    proc = subprocess.run(
+        [sys.executable, '-c', code], cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    return proc.stdout.split()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        run(SEED.format(rows=rows, farmers=FARMERS), env)
+
+        print(f'{rows} rows, {FARMERS} farmers')
+        for listing, label, func in VARIANTS:
+            count, elapsed, baseline, peak = run(CHILD.format(func=func), env)
+            count, elapsed = int(count), float(elapsed)
+            print(
+                f'{listing:9} {label:11} {count / elapsed:10.0f} rows/s  '
+                f'{elapsed * 1000:8.1f} ms  peak RSS {int(peak) / 1024:6.1f} MiB '
+                f'(+{(int(peak) - int(baseline)) / 1024:.1f} MiB over startup)'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Cold-start cost of create_app(), measured with `python -X importtime` in a
+fresh interpreter per run.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import resource, time
+started = time.perf_counter()
+from app import create_app
+create_app({overrides!r})
+elapsed = time.perf_counter() - started
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+VARIANTS = {
+    'worker (no migrations)': {'LOAD_MIGRATIONS': False},
+    'cli (with migrations)': {'LOAD_MIGRATIONS': True},
+}
+
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_once(overrides):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(overrides=overrides)],
+        cwd=SERVER_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    elapsed, max_rss_kb = proc.stdout.split()
+
+    # Top-level imports only (no indentation) so cumulative times don't overlap
+    top_level = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            top_level.append((int(match.group(2)), match.group(4)))
+    return float(elapsed), int(max_rss_kb), sorted(top_level, reverse=True)
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    for label, overrides in VARIANTS.items():
+        results = [run_once(overrides) for _ in range(runs)]
+        wall = statistics.median(r[0] for r in results) * 1000
+        rss = statistics.median(r[1] for r in results) / 1024
+        print(f'{label}: {wall:.1f} ms to create_app(), {rss:.1f} MiB max RSS (median of {runs})')
+        for cumulative_us, module in results[-1][2][:8]:
+            print(f'    {cumulative_us / 1000:8.1f} ms  {module}')
+
+
+if __name__ == '__main__':
+    main()
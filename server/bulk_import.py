@@ -0,0 +1,156 @@
+# bulk_import.py
+import csv
+import io
+import json
+import math
+
+from sqlalchemy import case
+
+from sqlutil import dialect_insert
+
+CSV_MIMETYPES = ('text/csv',)
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Columns a bulk row may set; sku identifies the product within a farm
+UPSERT_COLUMNS = ('name', 'description', 'price', 'category', 'quantity', 'image_url')
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+def detect_format(mimetype):
+    if mimetype in CSV_MIMETYPES:
+        return 'csv'
+    if mimetype in NDJSON_MIMETYPES:
+        return 'ndjson'
+    return None
+
+
+def iter_rows(stream, fmt):
+    """
+    Lazily yield (row_number, row, error) from a CSV or NDJSON byte stream,
+    one line at a time so large files never sit in memory
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        if not reader.fieldnames or 'sku' not in reader.fieldnames:
+            raise BulkFormatError('CSV header must include a sku column')
+        try:
+            for row in reader:
+                yield reader.line_num, row, None
+        except csv.Error as e:
+            raise BulkFormatError(f'malformed CSV ({e})')
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, 'Each line must be a JSON object'
+            continue
+        yield line_number, row, None
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _integer(value):
+    # CSV gives strings; NDJSON may give floats, which must be whole, and
+    # bools, which json parses but aren't counts
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    return int(value)
+
+
+def validate_row(row, farmer_id):
+    """
+    Normalize a raw row into column values, returning (values, errors)
+    """
+    errors = []
+
+    sku = row.get('sku')
+    sku = str(sku).strip() if not _blank(sku) else None
+    if not sku:
+        errors.append('sku is required')
+    elif len(sku) > 64:
+        errors.append('sku must be at most 64 characters')
+
+    name = row.get('name')
+    name = str(name).strip() if not _blank(name) else None
+    if not name:
+        errors.append('name is required')
+    elif len(name) > 100:
+        errors.append('name must be at most 100 characters')
+
+    price = None
+    try:
+        if isinstance(row.get('price'), bool):
+            raise ValueError(row.get('price'))
+        price = float(row.get('price'))
+        if not (math.isfinite(price) and price >= 0):
+            errors.append('price must be a non-negative number')
+    except (TypeError, ValueError):
+        errors.append('price must be a number')
+
+    quantity = 0
+    if not _blank(row.get('quantity')):
+        try:
+            quantity = _integer(row.get('quantity'))
+            if quantity < 0:
+                errors.append('quantity must not be negative')
+        except (TypeError, ValueError):
+            errors.append('quantity must be an integer')
+
+    category = str(row.get('category') or '')
+    if len(category) > 50:
+        errors.append('category must be at most 50 characters')
+
+    image_url = str(row.get('image_url') or '')
+    if len(image_url) > 200:
+        errors.append('image_url must be at most 200 characters')
+
+    if errors:
+        return None, errors
+
+    return {
+        'sku': sku,
+        'farmer_id': farmer_id,
+        'name': name,
+        'description': str(row.get('description') or ''),
+        'price': price,
+        'category': category,
+        'quantity': quantity,
+        'image_url': image_url
+    }, []
+
+
+def build_upsert(table, dialect_name):
+    """
+    INSERT ... ON CONFLICT (farmer_id, sku) DO UPDATE for the given dialect.
+    An update never sets quantity below the units held in carts (see
+    holds.py), so live holds stay covered.
+    """
+    insert = dialect_insert(dialect_name)
+    stmt = insert(table)
+    set_ = {column: stmt.excluded[column] for column in UPSERT_COLUMNS}
+    set_['quantity'] = case(
+        (stmt.excluded.quantity < table.c.reserved_quantity, table.c.reserved_quantity),
+        else_=stmt.excluded.quantity
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.farmer_id, table.c.sku],
+        set_=set_
+    )
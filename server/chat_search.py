@@ -0,0 +1,156 @@
+# chat_search.py
+import html
+import re
+from datetime import datetime
+
+from sqlalchemy import DDL, DateTime, event, text
+
+from models import db, ChatMessage
+from pagination import InvalidCursor
+
+# Highlight markers for snippets; swapped for <mark> after HTML-escaping so
+# message text can't inject markup
+_START, _STOP = '\x02', '\x03'
+_WORD_RE = re.compile(r'\w+')
+# A word, and a trailing * to match it as a prefix
+_TERM_RE = re.compile(r'(\w+)(\*?)')
+_PREFIX_RE = re.compile(r'(\w+)\*')
+
+# SQLite: an external-content FTS5 index over chat_message.message, kept in
+# sync by triggers. Created with the table by create_all() as well as by the
+# migration. (Postgres uses the GIN index declared in models.py.)
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "message, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_insert AFTER INSERT ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_delete AFTER DELETE ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_update AFTER UPDATE OF message ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO chat_message_fts(rowid, message) VALUES (new.id, new.message); END",
+)
+
+for _statement in SQLITE_FTS_DDL:
+    event.listen(ChatMessage.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+event.listen(
+    ChatMessage.__table__, 'after_drop',
+    DDL('DROP TABLE IF EXISTS chat_message_fts').execute_if(dialect='sqlite')
+)
+
+_POSTGRES_SEARCH = '''
+WITH page AS (
+    SELECT id, ts_rank_cd(to_tsvector('simple'::regconfig, message), query)::float8 AS score
+    FROM chat_message, (SELECT {query} AS query) AS q
+    WHERE to_tsvector('simple'::regconfig, message) @@ query AND {participants}
+    ORDER BY score DESC, id DESC
+)
+SELECT m.id, m.sender_id, m.receiver_id, m.timestamp, page.score,
+       ts_headline('simple'::regconfig, m.message, {query},
+                   'StartSel=' || :start || ', StopSel=' || :stop || ', MaxWords=24, MinWords=8, MaxFragments=2') AS snippet
+FROM (SELECT * FROM page WHERE {after} ORDER BY score DESC, id DESC LIMIT :limit) AS page
+JOIN chat_message m ON m.id = page.id
+ORDER BY page.score DESC, m.id DESC
+'''
+
+_SQLITE_SEARCH = '''
+SELECT id, sender_id, receiver_id, timestamp, score, snippet FROM (
+    SELECT m.id, m.sender_id, m.receiver_id, m.timestamp, -bm25(chat_message_fts) AS score,
+           snippet(chat_message_fts, 0, :start, :stop, '…', 16) AS snippet
+    FROM chat_message_fts JOIN chat_message m ON m.id = chat_message_fts.rowid
+    WHERE chat_message_fts MATCH :q AND {participants}
+)
+WHERE {after}
+ORDER BY score DESC, id DESC
+LIMIT :limit
+'''
+
+
+def _fts5_query(q):
+    # Quote every word so user input can't form FTS5 syntax; words are ANDed
+    return ' '.join(f'"{word}"{star}' for word, star in _TERM_RE.findall(q))
+
+
+def _postgres_query(q):
+    # Prefix words become 'word':* terms ANDed to the websearch query made
+    # from the rest; either part may be empty
+    prefixes = _PREFIX_RE.findall(q)
+    if not prefixes:
+        return "websearch_to_tsquery('simple'::regconfig, :q)", {'q': q}
+    return (
+        "(websearch_to_tsquery('simple'::regconfig, :q) && to_tsquery('simple'::regconfig, :prefixes))",
+        {'q': _PREFIX_RE.sub(' ', q), 'prefixes': ' & '.join(f"'{word}':*" for word in prefixes)}
+    )
+
+
+def highlight(snippet):
+    escaped = html.escape(snippet or '')
+    return escaped.replace(_START, '<mark>').replace(_STOP, '</mark>')
+
+
+def search_statement(dialect_name, user_id, q, other_user_id=None, after=None, limit=20):
+    """
+    Build the ranked search for dialect_name as (statement, params), or
+    None when q has no words to match. A word ending in * matches as a
+    prefix (tomat* finds tomatoes). after is the previous page's last
+    (score, id).
+    """
+    if dialect_name == 'postgresql':
+        query, params = _postgres_query(q)
+        sql = _POSTGRES_SEARCH.replace('{query}', query)
+    elif dialect_name == 'sqlite':
+        sql, params = _SQLITE_SEARCH, {'q': _fts5_query(q)}
+    else:
+        raise NotImplementedError(f'Chat search is not supported on {dialect_name}')
+    if not _WORD_RE.search(q):
+        return None
+
+    params.update(user_id=user_id, start=_START, stop=_STOP, limit=limit)
+    if other_user_id is None:
+        participants = '(sender_id = :user_id OR receiver_id = :user_id)'
+    else:
+        participants = ('((sender_id = :user_id AND receiver_id = :other_user_id) '
+                        'OR (sender_id = :other_user_id AND receiver_id = :user_id))')
+        params['other_user_id'] = other_user_id
+
+    if after is None:
+        after_clause = '1 = 1'
+    else:
+        if (len(after) != 2 or not isinstance(after[0], (int, float)) or isinstance(after[0], bool)
+                or not isinstance(after[1], int) or isinstance(after[1], bool)):
+            raise InvalidCursor('Invalid cursor')
+        after_clause = 'score < :after_score OR (score = :after_score AND id < :after_id)'
+        params['after_score'], params['after_id'] = float(after[0]), after[1]
+
+    if dialect_name == 'sqlite':
+        # m.sender_id etc. inside the FTS join
+        participants = participants.replace('sender_id', 'm.sender_id').replace('receiver_id', 'm.receiver_id')
+
+    stmt = text(sql.format(participants=participants, after=after_clause)).columns(timestamp=DateTime)
+    return stmt, params
+
+
+def search_results(rows):
+    return [{
+        'id': row['id'],
+        'sender_id': row['sender_id'],
+        'receiver_id': row['receiver_id'],
+        'timestamp': row['timestamp'].isoformat() if isinstance(row['timestamp'], datetime) else row['timestamp'],
+        'snippet': highlight(row['snippet']),
+        # Only comparable within one query; kept for the next page's cursor
+        # and left out of responses
+        'score': row['score']
+    } for row in rows]
+
+
+def search_messages(user_id, q, other_user_id=None, after=None, limit=20):
+    """
+    Rank the user's chat messages matching q, best first, with highlighted
+    snippets. Only conversations the user takes part in (optionally just
+    the one with other_user_id) are searched. Returns result dicts carrying
+    their own score for the next cursor.
+    """
+    search = search_statement(db.session.get_bind().dialect.name, user_id, q, other_user_id, after, limit)
+    if search is None:
+        return []
+    return search_results(db.session.execute(*search).mappings())
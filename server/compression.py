@@ -0,0 +1,89 @@
+# compression.py
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; fall back to gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json', 'text/html', 'text/css', 'text/plain',
+    'application/javascript', 'text/javascript', 'image/svg+xml'
+)
+
+
+def compress(data, encoding, gzip_level=5, brotli_quality=4):
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def choose_encoding(accept_encodings):
+    """
+    Pick the best supported content coding the client accepts
+    """
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+
+class Compressor:
+    """
+    Compresses dynamic responses above COMPRESS_MIN_SIZE. The default
+    levels (gzip 5, brotli 4) sit where further levels cost noticeably more
+    CPU for a few percent smaller JSON; see benchmarks/bench_compression.py.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('COMPRESS_ENABLED', True):
+            return
+        self.enabled = True
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.gzip_level = app.config['COMPRESS_GZIP_LEVEL']
+        self.brotli_quality = app.config['COMPRESS_BROTLI_QUALITY']
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        # The ASGI server compresses its async views' responses off the
+        # event loop instead (see AsgiApp._dispatch)
+        if request.environ.get('smartfarm.compress_off_loop'):
+            return response
+        return self.compress_response(response)
+
+    def compress_response(self, response):
+        if (
+            response.direct_passthrough
+            or response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            # Sub-requests are embedded in the /api/batch body, which is
+            # compressed as a whole
+            or request.environ.get('smartfarm.batch')
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        response.set_data(compress(data, encoding, self.gzip_level, self.brotli_quality))
+        response.headers['Content-Encoding'] = encoding
+        if response.headers.get('ETag'):
+            # A compressed representation needs its own validator
+            response.set_etag(f'{response.get_etag()[0]}-{encoding}', weak=True)
+        return response
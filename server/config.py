@@ -8,8 +8,137 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') 
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # flask_migrate/alembic are only needed by the `flask db` CLI
+    LOAD_MIGRATIONS = os.environ.get('LOAD_MIGRATIONS', 'true').lower() == 'true'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
     
+    # "Farms near me" search
+    NEAR_DEFAULT_RADIUS_KM = float(os.environ.get('NEAR_DEFAULT_RADIUS_KM', 25))
+    NEAR_MAX_RADIUS_KM = float(os.environ.get('NEAR_MAX_RADIUS_KM', 500))
+    
+    # Product image uploads (stored content-addressed on local disk)
+    IMAGE_UPLOAD_FOLDER = os.environ.get('IMAGE_UPLOAD_FOLDER', os.path.join(basedir, 'uploads'))
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    IMAGE_MAX_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40 * 1000 * 1000))
+    IMAGE_THUMBNAIL_SIZES = {'sm': 160, 'md': 400, 'lg': 800}
+    IMAGE_THUMBNAIL_WORKERS = int(os.environ.get('IMAGE_THUMBNAIL_WORKERS', 2))
+    IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+    
+    # Bulk product import
+    BULK_IMPORT_CHUNK_SIZE = int(os.environ.get('BULK_IMPORT_CHUNK_SIZE', 1000))
+    BULK_IMPORT_MAX_ERRORS = int(os.environ.get('BULK_IMPORT_MAX_ERRORS', 1000))
+    
+    # Batch endpoint
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_THREAD_WORKERS = int(os.environ.get('BATCH_THREAD_WORKERS', 4))
+    
+    # "Frequently bought together" recommendations
+    RECOMMENDATIONS_TOP_K = int(os.environ.get('RECOMMENDATIONS_TOP_K', 10))
+    RECOMMENDATIONS_BATCH_SIZE = int(os.environ.get('RECOMMENDATIONS_BATCH_SIZE', 500))
+    
+    # Cart inventory holds
+    CART_HOLD_TTL_SECONDS = int(os.environ.get('CART_HOLD_TTL_SECONDS', 15 * 60))
+    CART_SWEEP_INTERVAL = int(os.environ.get('CART_SWEEP_INTERVAL', 60))
+    
+    # Monthly partitions of order/chat_message (Postgres) and cold archives
+    # of months past retention, as gzip'd NDJSON under ARCHIVE_DIR
+    PARTITION_RETENTION_MONTHS = int(os.environ.get('PARTITION_RETENTION_MONTHS', 12))
+    PARTITION_PREMAKE_MONTHS = int(os.environ.get('PARTITION_PREMAKE_MONTHS', 3))
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(basedir, 'instance', 'archive'))
+    ARCHIVE_RESTORE_DAYS = int(os.environ.get('ARCHIVE_RESTORE_DAYS', 7))
+    
+    # Order status notifications (transactional outbox). OUTBOX_SINKS is a
+    # comma-separated list of log, file and http
+    OUTBOX_SINKS = [name.strip() for name in os.environ.get('OUTBOX_SINKS', 'log').split(',') if name.strip()]
+    OUTBOX_FILE_PATH = os.environ.get('OUTBOX_FILE_PATH', os.path.join(basedir, 'instance', 'outbox_events.ndjson'))
+    OUTBOX_HTTP_URL = os.environ.get('OUTBOX_HTTP_URL', '')
+    OUTBOX_HTTP_TIMEOUT = float(os.environ.get('OUTBOX_HTTP_TIMEOUT', 5))
+    # Set false when running `flask dispatch-outbox` as a separate process
+    OUTBOX_DISPATCH_IN_WORKERS = os.environ.get('OUTBOX_DISPATCH_IN_WORKERS', 'true').lower() == 'true'
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+    OUTBOX_POLL_INTERVAL = 5
+    # Held by the one process on the host that polls (see OutboxDispatcher)
+    OUTBOX_POLL_LOCK_PATH = os.environ.get('OUTBOX_POLL_LOCK_PATH', os.path.join(basedir, 'instance', 'outbox_poll.lock'))
+    OUTBOX_LEASE_SECONDS = 60
+    OUTBOX_MAX_ATTEMPTS = 8
+    OUTBOX_BACKOFF_BASE = 2
+    OUTBOX_BACKOFF_MAX = 300
+    
+    # Review listing (cursor paginated)
+    REVIEWS_PAGE_SIZE = int(os.environ.get('REVIEWS_PAGE_SIZE', 20))
+    REVIEWS_MAX_PAGE_SIZE = int(os.environ.get('REVIEWS_MAX_PAGE_SIZE', 100))
+    
+    # User directory (chat contact picker)
+    USERS_PAGE_SIZE = int(os.environ.get('USERS_PAGE_SIZE', 50))
+    USERS_MAX_PAGE_SIZE = int(os.environ.get('USERS_MAX_PAGE_SIZE', 200))
+    
+    # Chat message search
+    CHAT_SEARCH_PAGE_SIZE = int(os.environ.get('CHAT_SEARCH_PAGE_SIZE', 20))
+    CHAT_SEARCH_MAX_PAGE_SIZE = int(os.environ.get('CHAT_SEARCH_MAX_PAGE_SIZE', 50))
+    CHAT_SEARCH_MAX_QUERY_LENGTH = int(os.environ.get('CHAT_SEARCH_MAX_QUERY_LENGTH', 200))
+    
+    # Market price index
+    MARKET_PRICE_WINDOW_DAYS = int(os.environ.get('MARKET_PRICE_WINDOW_DAYS', 180))
+    MARKET_PRICE_MAX_WINDOW_DAYS = int(os.environ.get('MARKET_PRICE_MAX_WINDOW_DAYS', 730))
+    
+    # Response compression (brotli is used when installed, else gzip)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 5))
+    COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+    
+    # Production React build, served with precompressed variants
+    SERVE_CLIENT = os.environ.get('SERVE_CLIENT', 'true').lower() == 'true'
+    CLIENT_BUILD_DIR = os.environ.get('CLIENT_BUILD_DIR', os.path.join(os.path.dirname(basedir), 'client', 'build'))
+    STATIC_CACHE_MAX_AGE = 365 * 24 * 3600
+    
+    # Slow-query log (EXPLAIN plans are captured on Postgres only)
+    SLOW_QUERY_LOG_ENABLED = os.environ.get('SLOW_QUERY_LOG_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))
+    # Each process writes its own file, with its pid before the extension
+    SLOW_QUERY_LOG_PATH = os.environ.get('SLOW_QUERY_LOG_PATH', os.path.join(basedir, 'instance', 'slow_queries.log'))
+    SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+    SLOW_QUERY_LOG_BACKUPS = 5
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+    SLOW_QUERY_EXPLAIN_INTERVAL = 300
+    
+    # On-demand sampling profiler (admin only)
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR', os.path.join(basedir, 'instance', 'profiles'))
+    PROFILER_DEFAULT_HZ = 100
+    PROFILER_MAX_HZ = 1000
+    PROFILER_MAX_SECONDS = 120
+    
+    # ASGI serving (asgi.py): chat, the MPesa callback and catalog reads run
+    # on the event loop with their own async connection pool; all other
+    # routes run in a pool of ASGI_THREADS threads
+    ASGI_THREADS = int(os.environ.get('ASGI_THREADS', 8))
+    ASGI_MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 1024 * 1024))
+    ASYNC_DB_POOL_SIZE = int(os.environ.get('ASYNC_DB_POOL_SIZE', 10))
+    ASYNC_DB_MAX_OVERFLOW = int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 20))
+    ASYNC_DB_POOL_TIMEOUT = int(os.environ.get('ASYNC_DB_POOL_TIMEOUT', 30))
+    
+    # Rate limiting. 'memory' keeps buckets per process; 'mmap' shares them
+    # between all gunicorn workers on the host through RATELIMIT_MMAP_PATH,
+    # and is the default under gunicorn (see gunicorn.conf.py).
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() == 'true'
+    RATELIMIT_STORAGE = os.environ.get('RATELIMIT_STORAGE', 'memory')
+    RATELIMIT_MMAP_PATH = os.environ.get('RATELIMIT_MMAP_PATH', os.path.join(basedir, 'instance', 'ratelimit.bin'))
+    RATELIMIT_MMAP_SLOTS = int(os.environ.get('RATELIMIT_MMAP_SLOTS', 65536))
+    # Anonymous clients are limited per IP. Behind reverse proxies, set this
+    # to how many of them append to X-Forwarded-For (1 on Render); otherwise
+    # every client shares the proxy's address and so one bucket
+    RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+    # Endpoint -> {'client': (burst, tokens/sec), 'route': (burst, tokens/sec)}
+    RATELIMIT_LIMITS = {
+        'api.login': {'client': (5, 5 / 60), 'route': (100, 20)},
+        'api.register': {'client': (5, 5 / 60), 'route': (50, 5)},
+        'api.get_products': {'client': (30, 10), 'route': (500, 200)},
+        'api.bulk_upsert_products': {'client': (2, 1 / 60)},
+        'api.get_market_prices': {'client': (20, 5)},
+        'api.search_chat_messages': {'client': (20, 5)},
+        'api.mpesa_callback': {'client': (50, 20), 'route': (500, 200)},
+    }
+    
     # MPesa configuration (use sandbox credentials for development)
     MPESA_CONSUMER_KEY = os.environ.get('MPESA_CONSUMER_KEY', '')
     MPESA_CONSUMER_SECRET = os.environ.get('MPESA_CONSUMER_SECRET', '')
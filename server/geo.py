@@ -0,0 +1,136 @@
+# geo.py
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 9
+
+
+def encode_geohash(lat, lng, precision=MAX_PRECISION):
+    """
+    Encode a latitude/longitude pair as a geohash string
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Return the (lat, lng) size in degrees of a geohash cell at this precision
+    """
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def precision_for_radius(lat, radius_km):
+    """
+    Pick the finest precision whose cells are at least as large as the search
+    radius in both directions, so a 3x3 block of cells covers the circle
+    """
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+
+    for precision in range(MAX_PRECISION, 0, -1):
+        lat_size, lng_size = cell_size(precision)
+        if lat_size >= dlat and lng_size >= dlng:
+            return precision
+    return 0
+
+
+def covering_prefixes(lat, lng, radius_km):
+    """
+    Return the geohash prefixes of the cell containing the point and its eight
+    neighbours. An empty list means the radius is too large to prune with.
+    """
+    precision = precision_for_radius(lat, radius_km)
+    if precision == 0:
+        return []
+
+    lat_size, lng_size = cell_size(precision)
+    prefixes = set()
+    for dy in (-1, 0, 1):
+        cell_lat = min(max(lat + dy * lat_size, -90.0), 90.0)
+        for dx in (-1, 0, 1):
+            cell_lng = (lng + dx * lng_size + 180.0) % 360.0 - 180.0
+            prefixes.add(encode_geohash(cell_lat, cell_lng, precision))
+    return sorted(prefixes)
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """
+    Vectorized great-circle distance from one point to arrays of points
+    """
+    import numpy as np
+
+    lat1 = np.radians(lat)
+    lat2 = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64)) - np.radians(lng)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_radius(lat, lng, radius_km, lats, lngs):
+    """
+    Return the indices of the points within radius_km, nearest first, along
+    with their distances
+    """
+    import numpy as np
+
+    distances = haversine_km(lat, lng, lats, lngs)
+    keep = np.flatnonzero(distances <= radius_km)
+    keep = keep[np.argsort(distances[keep], kind='stable')]
+    return keep.tolist(), distances[keep].tolist()
+
+
+def to_point(lat, lng):
+    """
+    Coerce a latitude/longitude pair to floats, raising ValueError if it is
+    malformed or out of range
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError('Coordinates must be numbers')
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('Coordinates out of range')
+    return lat, lng
+
+
+def parse_point(value):
+    """
+    Parse a "lat,lng" string, raising ValueError if it is malformed
+    """
+    parts = value.split(',')
+    if len(parts) != 2:
+        raise ValueError('Expected "lat,lng"')
+    return to_point(*parts)
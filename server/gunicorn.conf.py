@@ -0,0 +1,48 @@
+# gunicorn.conf.py
+import gc
+import os
+
+# SERVER_MODE=asgi serves asgi:app on uvicorn workers, where chat, payment
+# callbacks and catalog reads run on an event loop (see asgi_app.py)
+server_mode = os.environ.get('SERVER_MODE', 'wsgi')
+if server_mode == 'asgi':
+    wsgi_app = 'asgi:app'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'wsgi:app'
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Import the app once in the master so workers share its memory
+# copy-on-write instead of each paying the import cost
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Rate limit buckets must be shared, or each worker would allow the full limit
+os.environ.setdefault('RATELIMIT_STORAGE', 'mmap')
+
+
+def on_starting(server):
+    from config import Config
+    if Config.RATELIMIT_ENABLED and Config.RATELIMIT_STORAGE != 'mmap' and server.cfg.workers > 1:
+        raise RuntimeError(
+            f'RATELIMIT_STORAGE={Config.RATELIMIT_STORAGE} keeps rate limits per worker; '
+            f'use mmap with {server.cfg.workers} workers'
+        )
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far out of the GC's tracked generations;
+    # otherwise collections in the worker touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import dispose_engines
+        app = server.app.wsgi()
+        dispose_engines(getattr(app, 'flask_app', app))
+
+
+def post_worker_init(worker):
+    from app import start_background_workers
+    start_background_workers(getattr(worker.wsgi, 'flask_app', worker.wsgi))
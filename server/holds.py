@@ -0,0 +1,268 @@
+# holds.py
+import heapq
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+
+from metrics import metrics
+from models import db, InventoryHold, Order, OrderItem, Product
+
+logger = logging.getLogger('smartfarm.holds')
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, available):
+        super().__init__(f'Only {available} units of product {product_id} are available')
+        self.product_id = product_id
+        self.available = available
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def available_quantity(product):
+    return max(0, (product.quantity or 0) - product.reserved_quantity)
+
+
+def _reserve(product_id, quantity):
+    # A single conditional UPDATE both checks and takes the stock, so
+    # concurrent holds can never reserve more than there is
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.quantity - Product.reserved_quantity >= quantity)
+        .values(reserved_quantity=Product.reserved_quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def _unreserve(rows):
+    """
+    Give back the stock of deleted holds, given as (product_id, quantity)
+    rows. Products are updated in id order, as checkout does, so a sweep and
+    a checkout touching the same products can't deadlock on their row locks.
+    """
+    totals = Counter()
+    for product_id, quantity in rows:
+        totals[product_id] += quantity
+    for product_id in sorted(totals):
+        db.session.execute(
+            update(Product)
+            .where(Product.id == product_id)
+            .values(reserved_quantity=Product.reserved_quantity - totals[product_id])
+            .execution_options(synchronize_session=False)
+        )
+
+
+def _delete_holds(*criteria):
+    # DELETE ... RETURNING only reports rows this transaction removed, so two
+    # workers sweeping the same holds can't both give their stock back
+    return db.session.execute(
+        delete(InventoryHold).where(*criteria)
+        .returning(InventoryHold.product_id, InventoryHold.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def _sell(product_id, quantity):
+    # Conditional like _reserve: stock held in carts isn't for sale
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.quantity - Product.reserved_quantity >= quantity)
+        .values(quantity=Product.quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def release_expired(now=None, product_id=None, user_id=None):
+    """
+    Delete lapsed holds and return their stock. Returns the product ids that
+    had holds released. The caller commits.
+    """
+    criteria = [InventoryHold.expires_at <= (now or datetime.utcnow())]
+    if product_id is not None:
+        criteria.append(InventoryHold.product_id == product_id)
+    if user_id is not None:
+        criteria.append(InventoryHold.user_id == user_id)
+
+    rows = _delete_holds(*criteria)
+    _unreserve(rows)
+    if rows:
+        metrics.increment('cart_holds_expired_total', len(rows))
+    return sorted({row[0] for row in rows})
+
+
+def set_hold(user_id, product_id, quantity, ttl):
+    """
+    Hold quantity units of a product for a user's cart, replacing any
+    previous hold on it and restarting the TTL. Returns the hold, or None
+    when quantity is 0. Raises InsufficientStock. The caller commits.
+    """
+    hold = db.session.execute(
+        select(InventoryHold)
+        .where(InventoryHold.user_id == user_id, InventoryHold.product_id == product_id)
+        .with_for_update()
+    ).scalar_one_or_none()
+
+    now = datetime.utcnow()
+    if hold is not None and hold.expires_at <= now:
+        # Lapsed but not swept yet: its stock is no longer ours to extend
+        release_expired(now, product_id=product_id, user_id=user_id)
+        hold = None
+
+    delta = quantity - (hold.quantity if hold else 0)
+    if delta > 0 and not _reserve(product_id, delta):
+        # The stock may only be tied up in other lapsed holds
+        if not release_expired(now, product_id=product_id) or not _reserve(product_id, delta):
+            product = db.session.get(Product, product_id)
+            held = hold.quantity if hold else 0
+            raise InsufficientStock(product_id, available_quantity(product) + held)
+    elif delta < 0:
+        _unreserve([(product_id, -delta)])
+
+    if quantity == 0:
+        if hold is not None:
+            db.session.delete(hold)
+        return None
+
+    if hold is None:
+        hold = InventoryHold(user_id=user_id, product_id=product_id)
+        db.session.add(hold)
+    hold.quantity = quantity
+    hold.expires_at = now + timedelta(seconds=ttl)
+    metrics.increment('cart_holds_placed_total')
+    return hold
+
+
+def take_stock(product_id, quantity):
+    """
+    Sell quantity units of a product directly, outside the cart. Lapsed
+    holds on the product are released first if they're in the way. Returns
+    False when there isn't enough available stock. The caller commits.
+    """
+    if _sell(product_id, quantity):
+        return True
+    return bool(release_expired(product_id=product_id)) and _sell(product_id, quantity)
+
+
+def release_hold(user_id, product_id):
+    """
+    Drop a user's hold on a product. The caller commits.
+    """
+    rows = _delete_holds(InventoryHold.user_id == user_id, InventoryHold.product_id == product_id)
+    _unreserve(rows)
+    return bool(rows)
+
+
+def checkout(user_id, phone_number):
+    """
+    Turn a user's live holds into a pending order. The stock was set aside
+    when each hold was placed, so it only moves from reserved to sold here.
+    Returns (order, ids of products whose holds had lapsed). Raises
+    EmptyCart or InsufficientStock. The caller commits, or rolls back on
+    error to restore the holds.
+    """
+    now = datetime.utcnow()
+    expired = release_expired(now, user_id=user_id)
+
+    # Claim the holds first so a concurrent checkout can't convert them twice
+    held = _delete_holds(InventoryHold.user_id == user_id, InventoryHold.expires_at > now)
+    if not held:
+        raise EmptyCart('No items are held in the cart')
+
+    prices = dict(db.session.execute(
+        select(Product.id, Product.price).where(Product.id.in_([row[0] for row in held]))
+    ).all())
+
+    order = Order(buyer_id=user_id, total_amount=0, phone_number=phone_number, status='pending')
+    # In id order, like _unreserve, so concurrent sweeps can't deadlock us
+    for product_id, quantity in sorted(held):
+        # Guards against stock lowered by the farmer after the hold was placed
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.quantity >= quantity)
+            .values(
+                quantity=Product.quantity - quantity,
+                reserved_quantity=Product.reserved_quantity - quantity
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            raise InsufficientStock(product_id, 0)
+        order.items.append(OrderItem(product_id=product_id, quantity=quantity, price=prices[product_id]))
+        order.total_amount += prices[product_id] * quantity
+
+    db.session.add(order)
+    metrics.increment('cart_checkouts_total')
+    return order, expired
+
+
+class HoldSweeper:
+    """
+    Releases lapsed holds in the background. The expiry of every hold placed
+    through this worker goes on a min-heap, so the thread sleeps until the
+    earliest is due and sweeps everything due by then in one statement.
+    CART_SWEEP_INTERVAL bounds the sleep so holds placed by other workers,
+    or before a restart, are swept too. start() is called once each worker
+    has booted (see app.start_background_workers), and sweeps right away;
+    threads don't survive fork, so it's never started in a preloading
+    master.
+    """
+
+    def __init__(self, app=None):
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config['CART_SWEEP_INTERVAL']
+
+    def start(self):
+        with self._cond:
+            self._start()
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='hold-sweeper', daemon=True)
+            self._thread.start()
+
+    def schedule(self, ttl):
+        with self._cond:
+            heapq.heappush(self._heap, time.monotonic() + ttl)
+            self._start()
+            self._cond.notify()
+
+    def _run(self):
+        # Holds that lapsed while no worker was running go first
+        self.sweep()
+        next_sweep = time.monotonic() + self.interval
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due = min(next_sweep, self._heap[0]) if self._heap else next_sweep
+                    if due <= now:
+                        break
+                    self._cond.wait(due - now)
+                while self._heap and self._heap[0] <= now:
+                    heapq.heappop(self._heap)
+            next_sweep = now + self.interval
+            self.sweep()
+
+    def sweep(self):
+        with self.app.app_context():
+            try:
+                release_expired()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception('Releasing expired cart holds failed')
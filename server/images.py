@@ -0,0 +1,170 @@
+# images.py
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+IMAGE_URL_PREFIX = '/api/images/'
+THUMBNAIL_FORMAT = 'jpg'
+
+# Formats Pillow may report for an upload, mapped to the stored extension
+_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+_FILENAME_RE = re.compile(r'^([0-9a-f]{64})(?:_([a-z]+))?\.(jpg|png|webp|gif)$')
+_URL_RE = re.compile(r'^' + re.escape(IMAGE_URL_PREFIX) + r'([0-9a-f]{64})\.(jpg|png|webp|gif)$')
+
+logger = logging.getLogger('smartfarm.images')
+
+_executor = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _get_executor(workers):
+    # Created lazily so each gunicorn worker gets its own pool after fork;
+    # spawned children avoid inheriting the request threads and DB sockets
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+
+def _shard_dir(root, digest):
+    return os.path.join(root, digest[:2])
+
+
+def _write_atomic(path, data):
+    # A unique temp file per writer, so concurrent uploads of the same image
+    # can't interleave; the last rename wins with identical content
+    directory, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=f'.{name}.', suffix='.tmp', delete=False) as f:
+        f.write(data)
+    # NamedTemporaryFile creates 0600; images are served as static files
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def _log_thumbnail_failure(src_path):
+    def done(future):
+        global _executor
+        error = future.exception()
+        if error is None:
+            return
+        logger.error('Thumbnail generation failed for %s', src_path, exc_info=error)
+        if isinstance(error, BrokenProcessPool):
+            # A crashed child breaks the pool for good; start a new one on the next upload
+            _executor = None
+    return done
+
+
+def generate_thumbnails(src_path, dest_prefix, sizes):
+    """
+    Write a JPEG thumbnail for every size label; runs in the process pool
+    """
+    from PIL import Image
+
+    with Image.open(src_path) as original:
+        original.load()
+        image = original.convert('RGB')
+
+    for label, max_side in sizes.items():
+        dest_path = f'{dest_prefix}_{label}.{THUMBNAIL_FORMAT}'
+        if os.path.exists(dest_path):
+            continue
+        thumb = image.copy()
+        thumb.thumbnail((max_side, max_side))
+        buf = io.BytesIO()
+        thumb.save(buf, 'JPEG', quality=82, optimize=True, progressive=True)
+        _write_atomic(dest_path, buf.getvalue())
+
+
+def store_image(data, root, sizes, workers, max_pixels):
+    """
+    Store an uploaded image under its SHA-256 digest and queue thumbnail
+    generation. Returns (digest, extension, created).
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            image_format = probe.format
+            # Dimensions come from the header; reject huge ones before the
+            # thumbnail worker decodes them into memory
+            width, height = probe.size
+            if width * height > max_pixels:
+                raise InvalidImage('Image dimensions are too large')
+            probe.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise InvalidImage('File is not a valid image')
+
+    ext = _EXTENSIONS.get(image_format)
+    if not ext:
+        raise InvalidImage(f'Unsupported image format: {image_format}')
+
+    digest = hashlib.sha256(data).hexdigest()
+    shard = _shard_dir(root, digest)
+    os.makedirs(shard, exist_ok=True)
+    path = os.path.join(shard, f'{digest}.{ext}')
+
+    # Duplicate uploads resolve to the same file and reuse its thumbnails
+    created = not os.path.exists(path)
+    if created:
+        _write_atomic(path, data)
+
+    dest_prefix = os.path.join(shard, digest)
+    if any(not os.path.exists(f'{dest_prefix}_{label}.{THUMBNAIL_FORMAT}') for label in sizes):
+        future = _get_executor(workers).submit(generate_thumbnails, path, dest_prefix, sizes)
+        future.add_done_callback(_log_thumbnail_failure(path))
+
+    return digest, ext, created
+
+
+def image_url(digest, ext, size=None):
+    if size:
+        return f'{IMAGE_URL_PREFIX}{digest}_{size}.{THUMBNAIL_FORMAT}'
+    return f'{IMAGE_URL_PREFIX}{digest}.{ext}'
+
+
+def image_url_for(url, size):
+    """
+    Return the thumbnail URL for a locally stored image, leaving remote URLs
+    untouched
+    """
+    if not url or not size:
+        return url
+    match = _URL_RE.match(url)
+    if not match:
+        return url
+    return image_url(match.group(1), match.group(2), size)
+
+
+def resolve_image(root, filename):
+    """
+    Map a requested filename to (directory, filename, is_final) on disk.
+    If a thumbnail is still being generated the original is returned with
+    is_final False. Returns None when nothing matches.
+    """
+    match = _FILENAME_RE.match(filename)
+    if not match:
+        return None
+
+    digest, size, _ = match.groups()
+    shard = _shard_dir(root, digest)
+    if os.path.exists(os.path.join(shard, filename)):
+        return shard, filename, True
+
+    if size:
+        for ext in _EXTENSIONS.values():
+            original = f'{digest}.{ext}'
+            if os.path.exists(os.path.join(shard, original)):
+                return shard, original, False
+    return None
@@ -0,0 +1,157 @@
+# market.py
+import threading
+from collections import OrderedDict
+
+QUANTILES = (0.25, 0.5, 0.75)
+BUCKETS = ('day', 'week', 'month')
+
+
+def grouped_quantiles(codes, values, n_groups, quantiles=QUANTILES):
+    """
+    Quantiles of values per integer group code, computed for every group at
+    once from a single sort. Returns (counts, mins, maxs, quantile matrix);
+    groups without values get NaN.
+    """
+    import numpy as np
+
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+
+    result = np.full((n_groups, len(quantiles)), np.nan)
+    mins = np.full(n_groups, np.nan)
+    maxs = np.full(n_groups, np.nan)
+    present = counts > 0
+    if not present.any():
+        return counts, mins, maxs, result
+
+    first, n = starts[present], counts[present]
+    mins[present] = values[first]
+    maxs[present] = values[first + n - 1]
+    for j, q in enumerate(quantiles):
+        # Linear interpolation between the closest ranks, as np.quantile does
+        position = first + q * (n - 1)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.minimum(lo + 1, first + n - 1)
+        frac = position - lo
+        result[present, j] = values[lo] + (values[hi] - values[lo]) * frac
+    return counts, mins, maxs, result
+
+
+def bucket_starts(timestamps, bucket):
+    """
+    Truncate datetime64 timestamps to the start of their day, ISO week
+    (Monday) or month
+    """
+    import numpy as np
+
+    days = timestamps.astype('datetime64[D]')
+    if bucket == 'day':
+        return days
+    if bucket == 'week':
+        # Day 0 of the epoch was a Thursday
+        return days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    return timestamps.astype('datetime64[M]').astype('datetime64[D]')
+
+
+def _summaries(labels, counts, mins, maxs, quantiles, key):
+    return [{
+        key: label,
+        'count': int(count),
+        'min': round(float(low), 2),
+        'q1': round(float(q[0]), 2),
+        'median': round(float(q[1]), 2),
+        'q3': round(float(q[2]), 2),
+        'max': round(float(high), 2)
+    } for label, count, low, high, q in zip(labels, counts, mins, maxs, quantiles) if count]
+
+
+def _trend_series(codes, labels, period_codes, period_labels, prices, key):
+    # Median price per group and period, over only the pairs that occur, so
+    # many product names over many periods don't allocate a dense grid
+    import numpy as np
+
+    pair_codes = codes.astype(np.int64) * len(period_labels) + period_codes
+    pairs, pair_index = np.unique(pair_codes, return_inverse=True)
+    counts, _, _, medians = grouped_quantiles(pair_index, prices, len(pairs), quantiles=(0.5,))
+    groups, periods = np.divmod(pairs, len(period_labels))
+
+    # pairs are sorted, so each group's periods are contiguous and in order
+    starts = np.r_[0, np.flatnonzero(np.diff(groups)) + 1]
+    ends = np.r_[starts[1:], len(pairs)]
+    return [{
+        key: str(labels[groups[start]]),
+        'points': [{
+            'period': str(period_labels[periods[j]]),
+            'median': round(float(medians[j, 0]), 2),
+            'count': int(counts[j])
+        } for j in range(start, end)]
+    } for start, end in zip(starts, ends)]
+
+
+def price_index(categories, names, prices, timestamps, bucket='week'):
+    """
+    Build the market price summary from parallel columns of transacted order
+    item prices: per-category and per-product-name distributions plus a
+    median-price trend per category and per product name for each time
+    bucket.
+    """
+    import numpy as np
+
+    prices = np.asarray(prices, dtype=np.float64)
+    categories = np.asarray([c or 'uncategorized' for c in categories], dtype=str)
+    names = np.asarray(names, dtype=str)
+    timestamps = np.asarray(timestamps, dtype='datetime64[s]')
+
+    if not len(prices):
+        return {'categories': [], 'products': [], 'trends': {'bucket': bucket, 'series': [], 'product_series': []}}
+
+    category_labels, category_codes = np.unique(categories, return_inverse=True)
+    name_labels, name_codes = np.unique(names, return_inverse=True)
+
+    by_category = grouped_quantiles(category_codes, prices, len(category_labels))
+    by_name = grouped_quantiles(name_codes, prices, len(name_labels))
+
+    periods = bucket_starts(timestamps, bucket)
+    period_labels, period_codes = np.unique(periods, return_inverse=True)
+
+    return {
+        'categories': _summaries(category_labels.tolist(), *by_category, key='category'),
+        'products': _summaries(name_labels.tolist(), *by_name, key='name'),
+        'trends': {
+            'bucket': bucket,
+            'series': _trend_series(category_codes, category_labels, period_codes, period_labels, prices, 'category'),
+            'product_series': _trend_series(name_codes, name_labels, period_codes, period_labels, prices, 'name')
+        }
+    }
+
+
+class PriceIndexCache:
+    """
+    Keeps computed price indexes until their version changes, so the arrays
+    are only rebuilt once per batch of new or updated orders
+    """
+
+    def __init__(self, max_entries=32):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+price_index_cache = PriceIndexCache()
@@ -1,4 +1,5 @@
 import logging
+import re
 from logging.config import fileConfig
 
 from flask import current_app
@@ -45,6 +46,24 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Tables in the database that the models don't declare: Postgres' monthly
+# and default partitions (see partitions.py), and the SQLite FTS5 table and
+# its shadow tables (see chat_search.py)
+UNMANAGED_TABLE_RE = re.compile(
+    r'^((order|chat_message)_(y\d{4}m\d{2}|default)|chat_message_fts(_\w+)?)$'
+)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and reflected and compare_to is None:
+        return not UNMANAGED_TABLE_RE.match(name)
+    # Indexes and constraints the models only create on other backends
+    ddl_if = getattr(object, '_ddl_if', None)
+    if not reflected and ddl_if is not None:
+        return ddl_if._should_execute(None, object, context.get_bind())
+    return True
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
         return target_db.metadatas[None]
@@ -93,6 +112,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -0,0 +1,112 @@
+"""partition order and chat_message by month
+
+Revision ID: 0a7e4c2b9d58
+Revises: f3a06d9b8c15
+Create Date: 2026-10-19 20:14:55.902361
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0a7e4c2b9d58'
+down_revision = 'f3a06d9b8c15'
+branch_labels = None
+depends_on = None
+
+# Table -> (partition column, columns referencing user.id)
+TABLES = {
+    'order': ('created_at', ['buyer_id']),
+    'chat_message': ('timestamp', ['sender_id', 'receiver_id']),
+}
+# Partitions created ahead of the current month; `flask partitions maintain`
+# keeps extending this
+PREMAKE_MONTHS = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _partition(table, column, user_columns):
+    # A partitioned table's primary key must include the partition column,
+    # and foreign keys can't point at the parent, so order_item.order_id
+    # loses its constraint (the ORM relationship is unaffected)
+    old = f'{table}_unpartitioned'
+    op.execute(f'''UPDATE "{table}" SET {column} = now() AT TIME ZONE 'utc' WHERE {column} IS NULL''')
+    op.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    op.execute(f'ALTER INDEX "{table}_pkey" RENAME TO "{old}_pkey"')
+    op.execute(f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS) PARTITION BY RANGE ({column})')
+    op.execute(f'ALTER TABLE "{table}" ALTER COLUMN {column} SET NOT NULL')
+    op.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, {column})')
+    op.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+
+    oldest = op.get_bind().execute(sa.text(f'SELECT min({column}) FROM "{old}"')).scalar()
+    now = datetime.utcnow()
+    month = datetime((oldest or now).year, (oldest or now).month, 1)
+    last = _add_months(datetime(now.year, now.month, 1), PREMAKE_MONTHS)
+    while month <= last:
+        op.execute(
+            f'CREATE TABLE "{table}_y{month:%Y}m{month:%m}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+        )
+        month = _add_months(month, 1)
+
+    op.execute(f'INSERT INTO "{table}" SELECT * FROM "{old}"')
+    op.execute(f'DROP TABLE "{old}"')
+    for user_column in user_columns:
+        op.create_foreign_key(None, table, 'user', [user_column], ['id'])
+
+
+def _unpartition(table, column, user_columns):
+    partitioned = f'{table}_partitioned'
+    op.execute(f'ALTER TABLE "{table}" RENAME TO "{partitioned}"')
+    op.execute(f'ALTER INDEX "{table}_pkey" RENAME TO "{partitioned}_pkey"')
+    op.execute(f'CREATE TABLE "{table}" (LIKE "{partitioned}" INCLUDING DEFAULTS)')
+    op.execute(f'ALTER TABLE "{table}" ALTER COLUMN {column} DROP NOT NULL')
+    op.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+    op.execute(f'ALTER SEQUENCE "{table}_id_seq" OWNED BY "{table}".id')
+    op.execute(f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"')
+    # Dropping the parent drops its partitions
+    op.execute(f'DROP TABLE "{partitioned}"')
+    for user_column in user_columns:
+        op.create_foreign_key(None, table, 'user', [user_column], ['id'])
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_constraint('order_item_order_id_fkey', 'order_item', type_='foreignkey')
+        for table, (column, user_columns) in TABLES.items():
+            _partition(table, column, user_columns)
+    else:
+        # Other backends keep plain tables; `flask partitions maintain`
+        # archives by deleting month ranges instead of dropping partitions
+        for table, (column, _) in TABLES.items():
+            op.execute(f'UPDATE "{table}" SET {column} = CURRENT_TIMESTAMP WHERE {column} IS NULL')
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), nullable=False)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_index('ix_chat_message_sender_receiver_timestamp', 'chat_message', ['sender_id', 'receiver_id', 'timestamp'], unique=False)
+    op.create_index('ix_order_buyer_id_created_at', 'order', ['buyer_id', 'created_at'], unique=False)
+    # ### end Alembic commands ###
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_index('ix_order_buyer_id_created_at', table_name='order')
+    op.drop_index('ix_chat_message_sender_receiver_timestamp', table_name='chat_message')
+    # ### end Alembic commands ###
+
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, (column, user_columns) in TABLES.items():
+            _unpartition(table, column, user_columns)
+        op.create_foreign_key('order_item_order_id_fkey', 'order_item', 'order', ['order_id'], ['id'])
+    else:
+        for table, (column, _) in TABLES.items():
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.alter_column(column, existing_type=sa.DateTime(), nullable=True)
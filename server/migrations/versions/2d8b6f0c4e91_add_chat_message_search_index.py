@@ -0,0 +1,56 @@
+"""add chat message search index
+
+Revision ID: 2d8b6f0c4e91
+Revises: 1c5f8e3a7b20
+Create Date: 2026-10-19 21:47:06.318524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d8b6f0c4e91'
+down_revision = '1c5f8e3a7b20'
+branch_labels = None
+depends_on = None
+
+# Mirrors chat_search.SQLITE_FTS_DDL at the time of this revision
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_message_fts USING fts5("
+    "message, content='chat_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_insert AFTER INSERT ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(rowid, message) VALUES (new.id, new.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_delete AFTER DELETE ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_message_fts_update AFTER UPDATE OF message ON chat_message BEGIN "
+    "INSERT INTO chat_message_fts(chat_message_fts, rowid, message) VALUES ('delete', old.id, old.message); "
+    "INSERT INTO chat_message_fts(rowid, message) VALUES (new.id, new.message); END",
+)
+
+
+def upgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        # Created on the partitioned parent, so every month's partition
+        # (including future ones) gets its own GIN index
+        op.create_index(
+            'ix_chat_message_message_tsv', 'chat_message',
+            [sa.text("to_tsvector('simple'::regconfig, message)")],
+            unique=False, postgresql_using='gin'
+        )
+    elif dialect_name == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        # Index the existing messages
+        op.execute("INSERT INTO chat_message_fts(chat_message_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect_name = op.get_bind().dialect.name
+    if dialect_name == 'postgresql':
+        op.drop_index('ix_chat_message_message_tsv', table_name='chat_message')
+    elif dialect_name == 'sqlite':
+        for trigger in ('chat_message_fts_update', 'chat_message_fts_delete', 'chat_message_fts_insert'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS chat_message_fts')
@@ -0,0 +1,66 @@
+"""add default partitions
+
+Revision ID: 3f9a2d7c5b14
+Revises: 2d8b6f0c4e91
+Create Date: 2026-10-19 23:12:40.581207
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2d7c5b14'
+down_revision = '2d8b6f0c4e91'
+branch_labels = None
+depends_on = None
+
+# Table -> partition column
+TABLES = {
+    'order': 'created_at',
+    'chat_message': 'timestamp',
+}
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def _is_partitioned(table):
+    return op.get_bind().execute(sa.text(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+        'WHERE c.relname = :name AND pg_table_is_visible(c.oid)'
+    ), {'name': table}).first() is not None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Rows outside the monthly partitions land here instead of failing, if
+    # `flask partitions maintain` stops running; it moves them back out
+    for table in TABLES:
+        if _is_partitioned(table):
+            op.execute(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    bind = op.get_bind()
+    for table, column in TABLES.items():
+        default = f'{table}_default'
+        if bind.execute(sa.text('SELECT to_regclass(:name)'), {'name': f'"{default}"'}).scalar() is None:
+            continue
+        # Give the default partition's rows monthly partitions of their own
+        op.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+        months = bind.execute(sa.text(f'''SELECT DISTINCT date_trunc('month', "{column}") FROM "{default}"''')).scalars()
+        for month in months:
+            op.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}_y{month:%Y}m{month:%m}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+            )
+        op.execute(f'INSERT INTO "{table}" SELECT * FROM "{default}"')
+        op.execute(f'DROP TABLE "{default}"')
@@ -0,0 +1,38 @@
+"""track counted recommendation orders
+
+Revision ID: 4a6c8e0b2d37
+Revises: 3f9a2d7c5b14
+Create Date: 2026-10-19 23:48:05.912364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a6c8e0b2d37'
+down_revision = '3f9a2d7c5b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('recommendation_order',
+    sa.Column('order_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.PrimaryKeyConstraint('order_id')
+    )
+    op.drop_table('job_checkpoint')
+    # The old high-water mark can't say which orders were counted, so the
+    # next refresh recounts every order
+    op.execute('DELETE FROM product_cooccurrence')
+
+
+def downgrade():
+    op.create_table('job_checkpoint',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.drop_table('recommendation_order')
+    op.execute('DELETE FROM product_cooccurrence')
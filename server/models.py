@@ -1,12 +1,42 @@
 
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, PrimaryKeyConstraint, event
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.ext.compiler import compiles
 from werkzeug.security import generate_password_hash, check_password_hash
 from serializer import SerializerMixin
+from geo import encode_geohash
 
 db = SQLAlchemy()
 
+def partitioned_by_month(column):
+    """
+    Table options for a table range partitioned by month on column in
+    Postgres (see partitions.py); other backends get a plain table
+    """
+    return {'postgresql_partition_by': f'RANGE ({column})', 'info': {'partition_column': column}}
+
+@compiles(PrimaryKeyConstraint, 'postgresql')
+def _compile_primary_key(constraint, compiler, **kw):
+    # A partitioned table's primary key must include its partition column.
+    # The ORM still identifies rows by id alone
+    ddl = compiler.visit_primary_key_constraint(constraint, **kw)
+    column = constraint.table.info.get('partition_column')
+    if not ddl or column is None:
+        return ddl
+    return f'{ddl[:-1]}, {compiler.preparer.quote(column)})'
+
+def _not_postgresql(ddl, target, bind, dialect=None, **kw):
+    return dialect.name != 'postgresql'
+
+def _create_default_partition(table):
+    # Catches rows outside the monthly partitions, e.g. if `flask partitions
+    # maintain` stops running, so inserts never fail for want of one
+    event.listen(table, 'after_create', DDL(
+        f'CREATE TABLE IF NOT EXISTS "{table.name}_default" PARTITION OF "{table.name}" DEFAULT'
+    ).execute_if(dialect='postgresql'))
+
 class User(SerializerMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -18,6 +48,9 @@ class User(SerializerMixin, db.Model):
     # Farmer-specific fields
     farm_name = db.Column(db.String(100))
     location = db.Column(db.String(200))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12), index=True)
     
     # Relationships
     products = db.relationship('Product', backref='farmer', lazy=True)
@@ -34,13 +67,45 @@ class User(SerializerMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+    def set_coordinates(self, latitude, longitude):
+        self.latitude = latitude
+        self.longitude = longitude
+        if latitude is None or longitude is None:
+            self.geohash = None
+        else:
+            self.geohash = encode_geohash(latitude, longitude)
+
+# Case-insensitive user directory browsing and prefix search
+db.Index('ix_user_type_username_lower', User.user_type, db.func.lower(User.username))
+db.Index('ix_user_type_farm_name_lower', User.user_type, db.func.lower(User.farm_name))
+# Listings across every user type order by lower(username) alone
+db.Index('ix_user_username_lower', db.func.lower(User.username))
+# Postgres prefix search uses LIKE, which needs the pattern operator class
+db.Index(
+    'ix_user_username_lower_pattern',
+    db.func.lower(User.username).label('username_lower'),
+    postgresql_ops={'username_lower': 'text_pattern_ops'}
+).ddl_if(dialect='postgresql')
+db.Index(
+    'ix_user_farm_name_lower_pattern',
+    db.func.lower(User.farm_name).label('farm_name_lower'),
+    postgresql_ops={'farm_name_lower': 'text_pattern_ops'}
+).ddl_if(dialect='postgresql')
+
 class Product(SerializerMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('farmer_id', 'sku', name='uq_product_farmer_sku'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64))  # Farmer-assigned stock code, used by bulk imports
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     price = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50))
     quantity = db.Column(db.Integer, default=0)
+    # Units held in buyers' carts; available stock is quantity - reserved_quantity
+    reserved_quantity = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     image_url = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     farmer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -52,11 +117,18 @@ class Product(SerializerMixin, db.Model):
     reviewers = association_proxy('reviews', 'user')
 
 class Order(SerializerMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_order_buyer_id_created_at', 'buyer_id', 'created_at'),
+        partitioned_by_month('created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     buyer_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, confirmed, shipped, delivered, cancelled
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # Versions the market price index cache (see routes.get_market_prices)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     mpesa_receipt = db.Column(db.String(50))
     phone_number = db.Column(db.String(15))
     
@@ -64,28 +136,116 @@ class Order(SerializerMixin, db.Model):
     items = db.relationship('OrderItem', backref='order', lazy=True)
 
 class OrderItem(SerializerMixin, db.Model):
+    __table_args__ = (
+        # Postgres can't reference a partitioned order by id alone; the ORM
+        # relationship still uses this foreign key
+        db.ForeignKeyConstraint(['order_id'], ['order.id']).ddl_if(callable_=_not_postgresql),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)
 
 class Review(SerializerMixin, db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_review_user_product'),
+        # One index per listing sort order, scanned forwards or backwards
+        # (lowest mixes directions, so its indexes follow Review below)
+        db.Index('ix_review_created_at_id', 'created_at', 'id'),
+        db.Index('ix_review_rating_created_at_id', 'rating', 'created_at', 'id'),
+        db.Index('ix_review_product_created_at_id', 'product_id', 'created_at', 'id'),
+        db.Index('ix_review_product_rating_created_at_id', 'product_id', 'rating', 'created_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # User submittable attribute (1-5 stars)
     comment = db.Column(db.Text)  # User submittable attribute
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', backref='reviews')
     product = db.relationship('Product', backref='reviews')
 
+# The lowest sort: rating ascending, newest first within a rating
+db.Index('ix_review_rating_created_at_desc_id_desc', Review.rating, Review.created_at.desc(), Review.id.desc())
+db.Index(
+    'ix_review_product_rating_created_at_desc_id_desc',
+    Review.product_id, Review.rating, Review.created_at.desc(), Review.id.desc()
+)
+
 class ChatMessage(SerializerMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_message_sender_receiver_timestamp', 'sender_id', 'receiver_id', 'timestamp'),
+        # Full-text search over messages (see chat_search.py); SQLite uses an
+        # FTS5 table instead
+        db.Index(
+            'ix_chat_message_message_tsv',
+            db.func.to_tsvector(db.literal_column("'simple'::regconfig"), db.column('message')),
+            postgresql_using='gin'
+        ).ddl_if(dialect='postgresql'),
+        partitioned_by_month('timestamp'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     receiver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    read = db.Column(db.Boolean, default=False)
\ No newline at end of file
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    read = db.Column(db.Boolean, default=False)
+
+_create_default_partition(Order.__table__)
+_create_default_partition(ChatMessage.__table__)
+
+class ProductCooccurrence(db.Model):
+    # Number of orders containing both products, stored in both directions;
+    # the diagonal (product_id == other_product_id) counts orders per product
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    other_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductRecommendation(db.Model):
+    # Precomputed top-K "frequently bought together" neighbours per product
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    related_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    
+    related_product = db.relationship('Product', foreign_keys=[related_product_id])
+
+class RecommendationOrder(db.Model):
+    # Orders whose items are counted in product_cooccurrence. No foreign
+    # key: archived orders leave the partitioned order table but stay counted
+    order_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+class InventoryHold(db.Model):
+    # Cart reservation of a product's stock, released when it expires
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_inventory_hold_user_product'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    product = db.relationship('Product')
+
+class OutboxEvent(db.Model):
+    # Notifications written in the same transaction as the change they
+    # describe, delivered later by outbox.OutboxDispatcher
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(50), nullable=False)
+    aggregate_id = db.Column(db.Integer, nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    failed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    # Comma-separated sinks that took the event, skipped when it's retried
+    delivered_sinks = db.Column(db.Text, nullable=False, default='', server_default='')
@@ -0,0 +1,358 @@
+# outbox.py
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, func, select, update
+
+from metrics import metrics
+from models import db, OutboxEvent
+
+logger = logging.getLogger('smartfarm.outbox')
+
+ORDER_STATUS_CHANGED = 'order.status_changed'
+
+
+def record_order_status(order, previous_status, session=None):
+    """
+    Queue an order.status_changed event in the current transaction, so it
+    commits or rolls back together with the status change itself. session
+    defaults to db.session; the async views pass their AsyncSession.
+    """
+    if order.status == previous_status:
+        return None
+    event = OutboxEvent(
+        topic=ORDER_STATUS_CHANGED,
+        aggregate_id=order.id,
+        payload=json.dumps({
+            'order_id': order.id,
+            'buyer_id': order.buyer_id,
+            'status': order.status,
+            'previous_status': previous_status,
+            'total_amount': order.total_amount,
+            'mpesa_receipt': order.mpesa_receipt,
+            'changed_at': datetime.utcnow().isoformat()
+        })
+    )
+    (session or db.session).add(event)
+    return event
+
+
+def coalesce(events):
+    """
+    Collapse each order's events, oldest first, into one notification with
+    its latest state and the status it started from
+    """
+    merged = {}
+    for event in events:
+        payload = json.loads(event.payload)
+        payload['topic'] = event.topic
+        key = (event.topic, event.aggregate_id)
+        first = merged.get(key)
+        if first is None:
+            payload['coalesced'] = 1
+        else:
+            payload['previous_status'] = first['previous_status']
+            payload['coalesced'] = first['coalesced'] + 1
+        merged[key] = payload
+    return list(merged.values())
+
+
+class LogSink:
+    def send(self, notifications):
+        for notification in notifications:
+            logger.info(json.dumps(notification))
+
+
+class FileSink:
+    """
+    Appends notifications as JSON lines; handy for local development and tests
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notifications):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lines = ''.join(json.dumps(n) + '\n' for n in notifications)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+class HttpSink:
+    """
+    POSTs each batch as {"events": [...]} to a webhook; any non-2xx response
+    fails the batch
+    """
+
+    def __init__(self, url, timeout):
+        if not url:
+            raise ValueError('OUTBOX_HTTP_URL must be set to use the http sink')
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notifications):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'events': notifications}).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+# Sink name (as used in OUTBOX_SINKS) -> factory taking the app config
+SINKS = {
+    'log': lambda config: LogSink(),
+    'file': lambda config: FileSink(config['OUTBOX_FILE_PATH']),
+    'http': lambda config: HttpSink(config['OUTBOX_HTTP_URL'], config['OUTBOX_HTTP_TIMEOUT']),
+}
+
+
+def register_sink(name, factory):
+    SINKS[name] = factory
+
+
+class OutboxDispatcher:
+    """
+    Drains the outbox in batches and hands coalesced notifications to every
+    configured sink. Delivery is at-least-once: events are claimed with a
+    lease (OUTBOX_LEASE_SECONDS) so several workers can dispatch at once and
+    a crashed one's claim simply lapses. Each event records the sinks that
+    took it, so a retry only goes to the sinks that failed; sinks must still
+    tolerate the odd repeat, from a lapsed lease or a crash before the
+    events were settled. Failed events are retried with exponential backoff
+    and given up on after OUTBOX_MAX_ATTEMPTS, each by its own count.
+
+    An order is only claimed once all its pending events are due, so its
+    notifications can't overtake each other across retries.
+
+    Every process dispatches right after its own commits (see notify), but
+    only the one holding the lock on OUTBOX_POLL_LOCK_PATH polls every
+    OUTBOX_POLL_INTERVAL for retries and events nobody was woken for. If
+    it exits, another worker takes the lock at its next timeout.
+    """
+
+    def __init__(self, app=None):
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._sinks = None
+        self._poll_fd = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config['OUTBOX_BATCH_SIZE']
+        self.poll_interval = app.config['OUTBOX_POLL_INTERVAL']
+        self.poll_lock_path = app.config['OUTBOX_POLL_LOCK_PATH']
+        self.lease = timedelta(seconds=app.config['OUTBOX_LEASE_SECONDS'])
+        self.max_attempts = app.config['OUTBOX_MAX_ATTEMPTS']
+        self.backoff_base = app.config['OUTBOX_BACKOFF_BASE']
+        self.backoff_max = app.config['OUTBOX_BACKOFF_MAX']
+        self.in_workers = app.config['OUTBOX_DISPATCH_IN_WORKERS']
+
+    @property
+    def sinks(self):
+        # Sink name -> sink, in OUTBOX_SINKS order
+        if self._sinks is None:
+            unknown = [name for name in self.app.config['OUTBOX_SINKS'] if name not in SINKS]
+            if unknown:
+                raise ValueError(f'Unknown outbox sinks: {", ".join(unknown)}')
+            self._sinks = {name: SINKS[name](self.app.config) for name in self.app.config['OUTBOX_SINKS']}
+        return self._sinks
+
+    def start(self):
+        """
+        Start the dispatcher thread in this worker when
+        OUTBOX_DISPATCH_IN_WORKERS is set. Called once the worker has booted
+        (see app.start_background_workers); the thread first drains whatever
+        is already due, e.g. events left pending by a restart.
+        """
+        if not self.in_workers:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run_forever, name='outbox-dispatcher', daemon=True)
+                self._thread.start()
+
+    def notify(self):
+        """
+        Wake the dispatcher after committing events
+        """
+        if not self.in_workers:
+            return
+        self.start()
+        self._wake.set()
+
+    def run_forever(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.drain()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('Outbox dispatch failed')
+            while not self._wake.wait(self.poll_interval) and not self._holds_poll_lock():
+                pass
+            self._wake.clear()
+
+    def _holds_poll_lock(self):
+        # POSIX record locks aren't inherited across fork and are released
+        # when their process exits, so exactly one live process holds it
+        if self._poll_fd is None:
+            os.makedirs(os.path.dirname(self.poll_lock_path) or '.', exist_ok=True)
+            fd = os.open(self.poll_lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._poll_fd = fd
+        return True
+
+    def drain(self):
+        """
+        Dispatch batches until nothing is due. Returns the number of events
+        delivered.
+        """
+        delivered = 0
+        while True:
+            claimed, sent = self.dispatch_once()
+            delivered += sent
+            if not claimed:
+                return delivered
+
+    def dispatch_once(self):
+        """
+        Claim, deliver and settle one batch. Returns (events claimed, events
+        delivered).
+        """
+        now = datetime.utcnow()
+        self._report_lag(now)
+        claimed = self._claim(now)
+        if not claimed:
+            return 0, 0
+
+        started = time.perf_counter()
+        delivered, errors = [], []
+        for name, sink in self.sinks.items():
+            pending = [event for event in claimed if name not in _sink_names(event)]
+            if not pending:
+                continue
+            try:
+                sink.send(coalesce(pending))
+            except Exception as e:
+                errors.append(f'{name}: {e!r}')
+            else:
+                delivered.append(name)
+        if errors:
+            self._fail(claimed, '; '.join(errors), delivered)
+            return len(claimed), 0
+
+        db.session.execute(
+            delete(OutboxEvent).where(OutboxEvent.id.in_([event.id for event in claimed]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        elapsed = time.perf_counter() - started
+        metrics.increment('outbox_events_delivered_total', len(claimed))
+        metrics.increment('outbox_notifications_sent_total', len({(e.topic, e.aggregate_id) for e in claimed}))
+        metrics.set_gauge('outbox_batch_events_per_second', round(len(claimed) / max(elapsed, 1e-6), 1))
+        return len(claimed), len(claimed)
+
+    def _report_lag(self, now):
+        oldest = db.session.execute(
+            select(func.min(OutboxEvent.created_at)).where(OutboxEvent.failed_at.is_(None))
+        ).scalar()
+        metrics.set_gauge('outbox_lag_seconds', round((now - oldest).total_seconds(), 3) if oldest else 0)
+
+    def _claim(self, now):
+        # Orders whose pending events are all due, oldest first. Claimed
+        # events have available_at pushed out by the lease, which also
+        # hides them from every other dispatcher
+        due_orders = (
+            select(OutboxEvent.aggregate_id)
+            .where(OutboxEvent.failed_at.is_(None))
+            .group_by(OutboxEvent.aggregate_id)
+            .having(func.max(OutboxEvent.available_at) <= now)
+            .order_by(func.min(OutboxEvent.id))
+            .limit(self.batch_size)
+        )
+        claimed = db.session.execute(
+            update(OutboxEvent)
+            .where(
+                OutboxEvent.aggregate_id.in_(due_orders),
+                OutboxEvent.available_at <= now,
+                OutboxEvent.failed_at.is_(None)
+            )
+            .values(available_at=now + self.lease)
+            .returning(
+                OutboxEvent.id, OutboxEvent.topic, OutboxEvent.aggregate_id, OutboxEvent.payload,
+                OutboxEvent.attempts, OutboxEvent.delivered_sinks
+            )
+            .execution_options(synchronize_session=False)
+        ).all()
+        db.session.commit()
+        return sorted(claimed, key=lambda event: event.id)
+
+    def _fail(self, claimed, message, delivered):
+        """
+        Record a failed attempt on each claimed event, along with the sinks
+        that did take it, and schedule its retry or give up on it
+        """
+        now = datetime.utcnow()
+        message = message[:1000]
+        metrics.increment('outbox_delivery_failures_total')
+        logger.warning('Outbox delivery of %d events failed: %s', len(claimed), message)
+
+        # Events that share an attempt count and sinks are settled together
+        groups = {}
+        for event in claimed:
+            sinks = ','.join(sorted(_sink_names(event) | set(delivered)))
+            groups.setdefault((event.attempts + 1, sinks), []).append(event.id)
+
+        for (attempts, sinks), ids in groups.items():
+            values = {'attempts': attempts, 'delivered_sinks': sinks, 'last_error': message}
+            if attempts >= self.max_attempts:
+                values['failed_at'] = now
+                metrics.increment('outbox_events_dead_total', len(ids))
+            else:
+                # Jittered so workers that failed together don't retry in lockstep
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+                values['available_at'] = now + timedelta(seconds=delay)
+            db.session.execute(
+                update(OutboxEvent).where(OutboxEvent.id.in_(ids)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        db.session.commit()
+
+
+def _sink_names(event):
+    # Sinks that already took the event, from its comma-separated column
+    return set(filter(None, event.delivered_sinks.split(',')))
+
+
+@click.command('dispatch-outbox')
+@click.option('--once', is_flag=True, help='Deliver what is due and exit.')
+@with_appcontext
+def dispatch_outbox_command(once):
+    """Deliver queued order notifications."""
+    dispatcher = current_app.extensions['outbox']
+    if once:
+        click.echo(f'Delivered {dispatcher.drain()} events')
+    else:
+        dispatcher.run_forever()
@@ -0,0 +1,43 @@
+# pagination.py
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    """
+    Opaque keyset cursor for the last row of a page. Datetimes survive the
+    round trip; everything else must be JSON-serialisable.
+    """
+    payload = [{'dt': v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor, length):
+    """
+    Inverse of encode_cursor. Raises InvalidCursor unless the cursor holds
+    exactly length values.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [
+            datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v
+            for v in payload
+        ]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidCursor('Invalid cursor')
+    if len(values) != length:
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def page_limit(requested, default, maximum):
+    if requested is None:
+        return default
+    return max(1, min(requested, maximum))
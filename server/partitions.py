@@ -0,0 +1,399 @@
+# partitions.py
+import gzip
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DateTime, and_, delete, func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from models import db, ChatMessage, Order, OrderItem
+
+# Table -> (monthly range column, child tables archived with it as
+# (table, column referencing the parent's id))
+PARTITIONED_TABLES = {
+    'order': (Order.__table__.c.created_at, [(OrderItem.__table__, 'order_id')]),
+    'chat_message': (ChatMessage.__table__.c.timestamp, []),
+}
+ARCHIVE_CHUNK_SIZE = 1000
+_PARTITION_SUFFIX_RE = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise ArchiveError(f'Month must be YYYY-MM, got {value!r}')
+
+
+def partition_name(table_name, month):
+    return f'{table_name}_y{month:%Y}m{month:%m}'
+
+
+def default_partition_name(table_name):
+    # Holds rows outside every monthly partition (see models.py)
+    return f'{table_name}_default'
+
+
+def archive_path(table_name, month, part=1):
+    # Rows archived after the month's first archive go to further parts
+    suffix = '' if part == 1 else f'.part{part}'
+    return os.path.join(current_app.config['ARCHIVE_DIR'], table_name, f'{month:%Y-%m}{suffix}.ndjson.gz')
+
+
+def archive_parts(table_name, month):
+    """
+    Paths of a month's archive parts, oldest first.
+    """
+    paths = []
+    while os.path.exists(archive_path(table_name, month, len(paths) + 1)):
+        paths.append(archive_path(table_name, month, len(paths) + 1))
+    return paths
+
+
+def is_partitioned(table_name):
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+        'WHERE c.relname = :name AND pg_table_is_visible(c.oid)'
+    ), {'name': table_name}).first() is not None
+
+
+def _partition_exists(name):
+    return db.session.execute(text('SELECT to_regclass(:name)'), {'name': f'"{name}"'}).scalar() is not None
+
+
+def _partition_months(table_name):
+    names = db.session.execute(text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent '
+        'WHERE p.relname = :name AND pg_table_is_visible(p.oid)'
+    ), {'name': table_name}).scalars()
+    months = set()
+    for name in names:
+        match = _PARTITION_SUFFIX_RE.search(name)
+        if match:
+            months.add(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return months
+
+
+def _default_months(table_name):
+    # Months with rows in the default partition
+    default = default_partition_name(table_name)
+    if not _partition_exists(default):
+        return []
+    column, _ = PARTITIONED_TABLES[table_name]
+    return sorted(db.session.execute(text(
+        f'''SELECT DISTINCT date_trunc('month', "{column.name}") FROM "{default}"'''
+    )).scalars())
+
+
+def _create_partition(table_name, month):
+    column, _ = PARTITIONED_TABLES[table_name]
+    name = partition_name(table_name, month)
+    default = default_partition_name(table_name)
+    in_month = f'"{column.name}" >= :start AND "{column.name}" < :end'
+    bounds = {'start': month, 'end': add_months(month, 1)}
+
+    # Postgres won't add a partition while rows for its range sit in the
+    # default partition, so those are moved over with the default detached
+    stray = _partition_exists(default) and db.session.execute(
+        text(f'SELECT 1 FROM "{default}" WHERE {in_month} LIMIT 1'), bounds
+    ).first() is not None
+    if stray:
+        db.session.execute(text(f'ALTER TABLE "{table_name}" DETACH PARTITION "{default}"'))
+    db.session.execute(text(
+        f'CREATE TABLE "{name}" PARTITION OF "{table_name}" '
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    ))
+    if stray:
+        db.session.execute(text(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE {in_month} RETURNING *) '
+            f'INSERT INTO "{table_name}" SELECT * FROM moved'
+        ), bounds)
+        db.session.execute(text(f'ALTER TABLE "{table_name}" ATTACH PARTITION "{default}" DEFAULT'))
+
+
+def ensure_partitions(table_name, first_month, last_month):
+    """
+    Create any missing monthly partitions from first_month to last_month
+    inclusive, moving in their rows from the default partition. Indexes
+    declared on the parent are created on each partition by Postgres.
+    Returns the names created.
+    """
+    created = []
+    month = first_month
+    while month <= last_month:
+        name = partition_name(table_name, month)
+        if not _partition_exists(name):
+            _create_partition(table_name, month)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def _write_ndjson(path, rows):
+    # Written beside the target and renamed into place, so a crash never
+    # leaves a truncated archive where a good one is expected
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    count = 0
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            for row in rows:
+                record = {key: value.isoformat() if isinstance(value, datetime) else value
+                          for key, value in row.items()}
+                f.write(json.dumps(record, separators=(',', ':')).encode() + b'\n')
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return count
+
+
+def _read_ndjson(path, table):
+    datetime_columns = {c.name for c in table.columns if isinstance(c.type, DateTime)}
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            row = json.loads(line)
+            for name in datetime_columns:
+                if row.get(name) is not None:
+                    row[name] = datetime.fromisoformat(row[name])
+            yield row
+
+
+def _read_parts(paths, table, identity):
+    """
+    Rows of every archive part, newest part first. A row archived again
+    (left live by an archive that was rolled back) is read from its newest
+    part only; an id archived for two different rows, told apart by their
+    identity column, raises ArchiveError rather than losing either.
+    """
+    seen = {}
+    for path in reversed(paths):
+        for row in _read_ndjson(path, table):
+            if row['id'] in seen:
+                if seen[row['id']] != row[identity]:
+                    raise ArchiveError(f'{table.name} id {row["id"]} is archived for two different rows')
+                continue
+            seen[row['id']] = row[identity]
+            yield row
+
+
+def _insert_ndjson(rows, table):
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= ARCHIVE_CHUNK_SIZE:
+            db.session.execute(insert(table), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(insert(table), chunk)
+        count += len(chunk)
+    return count
+
+
+def _stream(stmt):
+    return db.session.execute(stmt, execution_options={'stream_results': True, 'yield_per': ARCHIVE_CHUNK_SIZE}).mappings()
+
+
+def archive_month(table_name, month):
+    """
+    Move one month of a table, and the child rows belonging to it, to gzip'd
+    NDJSON files under ARCHIVE_DIR, then drop the month's partition (or
+    delete its rows where the table isn't partitioned). Rows that arrive
+    after a month was archived go to a new part beside the earlier ones;
+    once the month has been restored, the live rows are the whole month and
+    replace every part. Returns the number of parent rows archived. The
+    caller commits; the files are complete before anything is removed.
+    """
+    column, children = PARTITIONED_TABLES[table_name]
+    table = column.table
+    in_month = and_(column >= month, column < add_months(month, 1))
+    ids = select(table.c.id).where(in_month)
+
+    marker = _restore_marker(table_name, month)
+    restored = os.path.exists(marker)
+
+    count = db.session.execute(select(func.count()).select_from(table).where(in_month)).scalar()
+    if count:
+        for child, foreign_key in children:
+            _write_ndjson(
+                _next_part(child.name, month, restored),
+                _stream(select(child).where(child.c[foreign_key].in_(ids)).order_by(child.c.id))
+            )
+        _write_ndjson(_next_part(table_name, month, restored), _stream(select(table).where(in_month).order_by(table.c.id)))
+
+    for child, foreign_key in children:
+        db.session.execute(delete(child).where(child.c[foreign_key].in_(ids)))
+
+    name = partition_name(table_name, month)
+    if is_partitioned(table_name) and _partition_exists(name):
+        db.session.execute(text(f'ALTER TABLE "{table_name}" DETACH PARTITION "{name}"'))
+        db.session.execute(text(f'DROP TABLE "{name}"'))
+    elif count:
+        db.session.execute(delete(table).where(in_month))
+
+    if restored:
+        os.remove(marker)
+    return count
+
+
+def _next_part(table_name, month, replace):
+    parts = archive_parts(table_name, month)
+    if not replace:
+        return archive_path(table_name, month, len(parts) + 1)
+    # Every archived row is live again, so the earlier parts are redundant
+    # until this archive commits; the newest go first to keep the numbering
+    # contiguous
+    for path in reversed(parts[1:]):
+        os.remove(path)
+    return archive_path(table_name, month)
+
+
+def restore_month(table_name, month):
+    """
+    Load an archived month, every part of it, back into the live tables,
+    recreating its partition if needed. The month is then left alone by `maintain` for
+    ARCHIVE_RESTORE_DAYS. Returns the number of parent rows restored. The
+    caller commits.
+    """
+    column, children = PARTITIONED_TABLES[table_name]
+    parts = archive_parts(table_name, month)
+    if not parts:
+        raise ArchiveError(f'No archive of {table_name} for {month:%Y-%m}')
+
+    if is_partitioned(table_name):
+        ensure_partitions(table_name, month, month)
+    try:
+        count = _insert_ndjson(_read_parts(parts, column.table, column.name), column.table)
+        for child, foreign_key in children:
+            _insert_ndjson(_read_parts(archive_parts(child.name, month), child, foreign_key), child)
+    except IntegrityError:
+        db.session.rollback()
+        raise ArchiveError(f'{table_name} rows from {month:%Y-%m} are already in the database; was it restored before?')
+
+    keep_until = datetime.utcnow() + timedelta(days=current_app.config['ARCHIVE_RESTORE_DAYS'])
+    with open(_restore_marker(table_name, month), 'w') as f:
+        f.write(keep_until.isoformat())
+    return count
+
+
+def _restore_marker(table_name, month):
+    return archive_path(table_name, month) + '.restored'
+
+
+def _restored_until(table_name, month):
+    path = _restore_marker(table_name, month)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return datetime.fromisoformat(f.read().strip())
+
+
+def _months_before(table_name, cutoff):
+    column, _ = PARTITIONED_TABLES[table_name]
+    months = set()
+    oldest = db.session.execute(select(func.min(column))).scalar()
+    if oldest is not None:
+        month = month_start(oldest)
+        while month < cutoff:
+            months.add(month)
+            month = add_months(month, 1)
+    if is_partitioned(table_name):
+        # Empty partitions past retention are dropped too
+        months |= {month for month in _partition_months(table_name) if month < cutoff}
+    return sorted(months)
+
+
+def maintain(now=None):
+    """
+    Create the partitions for the current month and PARTITION_PREMAKE_MONTHS
+    ahead, and for months within retention whose rows landed in the default
+    partition. Then archive every month older than
+    PARTITION_RETENTION_MONTHS, one month per transaction. Returns
+    (partitions created, [(table, month, rows archived)]).
+    """
+    now = now or datetime.utcnow()
+    current = month_start(now)
+    cutoff = add_months(current, -current_app.config['PARTITION_RETENTION_MONTHS'])
+    premake = current_app.config['PARTITION_PREMAKE_MONTHS']
+
+    created, archived = [], []
+    for table_name in PARTITIONED_TABLES:
+        if is_partitioned(table_name):
+            created += ensure_partitions(table_name, current, add_months(current, premake))
+            for month in _default_months(table_name):
+                if month >= cutoff:
+                    created += ensure_partitions(table_name, month, month)
+            db.session.commit()
+
+        for month in _months_before(table_name, cutoff):
+            restored_until = _restored_until(table_name, month)
+            if restored_until is not None and restored_until > now:
+                continue
+            rows = archive_month(table_name, month)
+            db.session.commit()
+            if rows:
+                archived.append((table_name, month, rows))
+
+    return created, archived
+
+
+partitions_cli = AppGroup('partitions', help='Manage monthly partitions and cold archives.')
+
+
+@partitions_cli.command('maintain')
+def maintain_command():
+    """Create upcoming partitions and archive months past retention."""
+    created, archived = maintain()
+    for name in created:
+        click.echo(f'Created partition {name}')
+    for table_name, month, rows in archived:
+        click.echo(f'Archived {rows} {table_name} rows from {month:%Y-%m}')
+
+
+@partitions_cli.command('archive')
+@click.argument('table_name', type=click.Choice(list(PARTITIONED_TABLES)))
+@click.argument('month')
+def archive_command(table_name, month):
+    """Archive one month (YYYY-MM) of a table now."""
+    try:
+        rows = archive_month(table_name, parse_month(month))
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'Archived {rows} {table_name} rows from {month}')
+
+
+@partitions_cli.command('restore')
+@click.argument('table_name', type=click.Choice(list(PARTITIONED_TABLES)))
+@click.argument('month')
+def restore_command(table_name, month):
+    """Load an archived month (YYYY-MM) back into the database."""
+    try:
+        rows = restore_month(table_name, parse_month(month))
+    except ArchiveError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f'Restored {rows} {table_name} rows from {month}')
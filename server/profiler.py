@@ -0,0 +1,155 @@
+# profiler.py
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import request
+
+PROFILE_NAME_RE = re.compile(r'^profile-\d+-\d+\.folded$')
+
+
+# Route tag for the ASGI event loop thread (see asgi_app.py) while it
+# isn't running a request's task
+EVENT_LOOP_ROUTE = '<event-loop>'
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _current_task():
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+def collapse_stack(frame):
+    """
+    Render a frame's stack root-first in the collapsed format flamegraph.pl
+    and speedscope read ("outer;inner;leaf")
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack from a background thread at a fixed rate.
+    Each sample is prefixed with the endpoint the thread was serving, so one
+    flamegraph splits cleanly by route. Async views share the event loop
+    thread, so they are tagged per task, and a loop sample takes the tag of
+    the task running at the time. Only one run per process at a time.
+    """
+
+    def __init__(self, app=None):
+        self.active = False
+        self.routes = {}
+        self.task_routes = {}
+        self.loops = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.output_dir = app.config['PROFILER_OUTPUT_DIR']
+        app.before_request(self._enter_route)
+        app.teardown_request(self._exit_route)
+
+    def _enter_route(self):
+        # Tagged even while idle (a dict store), so requests already in
+        # flight when a profile starts are attributed too
+        route = request.endpoint or request.path
+        task = _current_task()
+        if task is None:
+            self.routes[threading.get_ident()] = route
+        else:
+            # The sampler can't read another thread's contextvars, so the
+            # tag is keyed by the task, and the loop found by its thread
+            self.task_routes[task] = route
+            self.loops[threading.get_ident()] = task.get_loop()
+
+    def _exit_route(self, exc=None):
+        task = _current_task()
+        if task is None:
+            self.routes.pop(threading.get_ident(), None)
+        else:
+            self.task_routes.pop(task, None)
+
+    def _route(self, thread_id):
+        loop = self.loops.get(thread_id)
+        if loop is None:
+            return self.routes.get(thread_id, '<idle>')
+        # The task may have yielded since its stack was captured; at worst a
+        # sample lands on the next task's route
+        return self.task_routes.get(asyncio.current_task(loop), EVENT_LOOP_ROUTE)
+
+    def start(self, seconds, hz):
+        """
+        Begin sampling in the background, returning the name of the file the
+        collapsed stacks will be written to
+        """
+        with self._lock:
+            if self.active:
+                raise ProfilerBusy('A profile is already running in this worker')
+            self.active = True
+
+        name = f'profile-{os.getpid()}-{int(time.time() * 1000)}.folded'
+        thread = threading.Thread(
+            target=self._run, args=(name, seconds, 1.0 / hz),
+            name='sampling-profiler', daemon=True
+        )
+        thread.start()
+        return name
+
+    def _run(self, name, seconds, interval):
+        own_id = threading.get_ident()
+        samples = Counter()
+        deadline = time.monotonic() + seconds
+        try:
+            next_tick = time.monotonic()
+            while next_tick < deadline:
+                frames = sys._current_frames()
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        samples[f'{self._route(thread_id)};{collapse_stack(frame)}'] += 1
+                # Don't keep other threads' frames (and their locals) alive
+                del frames, frame
+
+                next_tick += interval
+                delay = next_tick - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind (e.g. GIL contention); don't burst to catch up
+                    next_tick = time.monotonic()
+        finally:
+            self.active = False
+            self._write(name, samples)
+
+    def _write(self, name, samples):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, name)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            for stack, count in samples.most_common():
+                f.write(f'{stack} {count}\n')
+        os.replace(tmp_path, path)
+
+    def result_path(self, name):
+        """
+        Path of a finished profile, or None if it doesn't exist (yet)
+        """
+        if not PROFILE_NAME_RE.match(name):
+            return None
+        path = os.path.join(self.output_dir, name)
+        return path if os.path.isfile(path) else None
@@ -0,0 +1,201 @@
+# ratelimit.py
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from flask import jsonify, request
+
+from metrics import metrics
+
+
+class MemoryBucketStore:
+    """
+    Token buckets in a dict guarded by a lock; only visible to one process.
+    Past max_keys the least recently used bucket is evicted.
+    """
+
+    def __init__(self, max_keys=100000):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_keys = max_keys
+
+    def acquire(self, key, capacity, rate, now=None):
+        """
+        Take one token from the bucket for key, returning (allowed, retry_after)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self._max_keys:
+                    self._buckets.popitem(last=False)
+                tokens = capacity
+            else:
+                self._buckets.move_to_end(key)
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+
+class MmapBucketStore:
+    """
+    Token buckets in a fixed-size hash table in a shared mmap'd file, so every
+    gunicorn worker on the host sees the same counts. Each key probes a short
+    window of slots, which is byte-range locked for the update.
+    """
+
+    _SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update (epoch seconds)
+    _PROBE = 8
+
+    def __init__(self, path, slots=65536):
+        self._slots = max(slots, self._PROBE)
+        size = self._slots * self._SLOT.size
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != size:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size != size:
+                    os.ftruncate(self._fd, size)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+        self._thread_lock = threading.Lock()
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1
+
+    def acquire(self, key, capacity, rate, now=None):
+        now = time.time() if now is None else now
+        key_hash = self._hash(key)
+        first = key_hash % (self._slots - self._PROBE + 1)
+        offset = first * self._SLOT.size
+        length = self._PROBE * self._SLOT.size
+
+        # POSIX record locks only exclude other processes, so threads in this
+        # worker serialize on a local lock first
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, length, offset)
+            try:
+                allowed, tokens = self._update(offset, key_hash, capacity, rate, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, length, offset)
+
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def _update(self, offset, key_hash, capacity, rate, now):
+        target = None
+        oldest = None
+        for i in range(self._PROBE):
+            slot_offset = offset + i * self._SLOT.size
+            slot_hash, tokens, updated = self._SLOT.unpack_from(self._map, slot_offset)
+            if slot_hash == key_hash:
+                target = slot_offset
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+                break
+            if slot_hash == 0:
+                if target is None:
+                    target = slot_offset
+            elif oldest is None or updated < oldest[1]:
+                oldest = (slot_offset, updated)
+        else:
+            # New key: take an empty slot, or evict the least recently used
+            if target is None:
+                target = oldest[0]
+            tokens = capacity
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._SLOT.pack_into(self._map, target, key_hash, tokens, now)
+        return allowed, tokens
+
+
+class RateLimiter:
+    """
+    Per-route and per-client token buckets checked before each request.
+    Limits come from the RATELIMIT_LIMITS config, keyed by endpoint name.
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('RATELIMIT_ENABLED', True):
+            return
+
+        if app.config.get('RATELIMIT_STORAGE') == 'mmap':
+            self.store = MmapBucketStore(
+                app.config['RATELIMIT_MMAP_PATH'],
+                app.config['RATELIMIT_MMAP_SLOTS']
+            )
+        else:
+            self.store = MemoryBucketStore()
+
+        self.limits = app.config.get('RATELIMIT_LIMITS', {})
+        self.trusted_proxies = app.config.get('RATELIMIT_TRUSTED_PROXIES', 0)
+        self.secret_key = app.config['SECRET_KEY']
+        app.before_request(self.check)
+
+    def _client_key(self):
+        # Authenticated clients are limited per user, anonymous ones per IP
+        token = request.headers.get('Authorization', '')
+        if token.startswith('Bearer '):
+            try:
+                data = jwt.decode(token[7:], self.secret_key, algorithms=["HS256"])
+                return f"user:{data['user_id']}"
+            except (jwt.InvalidTokenError, KeyError):
+                pass
+        return f'ip:{self._client_ip()}'
+
+    def _client_ip(self):
+        # As werkzeug's ProxyFix(x_for=n): each trusted proxy appends the
+        # address it saw, so the client is the nth entry from the right and
+        # anything further left is whatever the client sent
+        if self.trusted_proxies:
+            forwarded = [ip.strip() for ip in request.headers.get('X-Forwarded-For', '').split(',')]
+            if len(forwarded) >= self.trusted_proxies and forwarded[-self.trusted_proxies]:
+                return forwarded[-self.trusted_proxies]
+        return request.remote_addr
+
+    def check(self):
+        # The ASGI server checks its async views off the event loop, since
+        # the mmap store waits on a file lock (see AsgiApp._dispatch)
+        if request.environ.get('smartfarm.ratelimit_checked'):
+            return None
+        return self.check_request()
+
+    def check_request(self):
+        limit = self.limits.get(request.endpoint)
+        if not limit:
+            return None
+
+        checks = []
+        if 'client' in limit:
+            checks.append(('client', f'{request.endpoint}:{self._client_key()}', limit['client']))
+        if 'route' in limit:
+            checks.append(('route', f'{request.endpoint}:*', limit['route']))
+
+        for scope, key, (capacity, rate) in checks:
+            allowed, retry_after = self.store.acquire(key, capacity, rate)
+            if not allowed:
+                metrics.increment('ratelimit_rejected_total', endpoint=request.endpoint, scope=scope)
+                response = jsonify({'message': 'Too many requests, please slow down'})
+                response.status_code = 429
+                response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+                return response
+        return None
@@ -0,0 +1,252 @@
+# read_models.py
+from datetime import datetime
+
+from sqlalchemy import and_, func, literal, or_, select, tuple_
+
+from models import db, User, Product, Order, OrderItem, Review
+from pagination import InvalidCursor
+from sqlutil import fold_case, prefix_match
+
+# Review listing sort -> keyset columns as (name, descending). Every key ends
+# in id so the order is total, and each has a matching index on Review. Ties
+# on rating list the newest reviews first in both directions
+REVIEW_SORTS = {
+    'newest': (('created_at', True), ('id', True)),
+    'highest': (('rating', True), ('created_at', True), ('id', True)),
+    'lowest': (('rating', False), ('created_at', True), ('id', True)),
+}
+_REVIEW_KEY_TYPES = {'created_at': datetime, 'rating': int, 'id': int}
+
+DIRECTORY_USER_TYPES = ('farmer', 'buyer')
+
+
+class ReadModel:
+    """
+    Base for lightweight, read-only row objects built straight from Core
+    select() results. They skip the ORM identity map and attribute
+    instrumentation; __slots__ keeps each instance to a fixed few pointers.
+    FIELDS lists the slots that go into to_dict(); any further slots are
+    loaded but kept internal.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls(*row) for row in rows]
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class ProductListing(ReadModel):
+    FIELDS = ('id', 'name', 'description', 'price', 'category', 'quantity',
+              'image_url', 'farmer_id', 'farmer_name', 'farm_name')
+    __slots__ = FIELDS + ('latitude', 'longitude')
+
+
+class OrderListing(ReadModel):
+    FIELDS = ('id', 'buyer_id', 'buyer_name', 'total_amount', 'status',
+              'created_at', 'mpesa_receipt', 'items')
+    __slots__ = FIELDS
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['created_at'] = self.created_at.isoformat() if self.created_at else None
+        result['items'] = [item.to_dict() for item in self.items]
+        return result
+
+
+class OrderItemListing(ReadModel):
+    FIELDS = ('id', 'product_id', 'product_name', 'quantity', 'price')
+    __slots__ = FIELDS + ('order_id',)
+
+
+class ReviewListing(ReadModel):
+    FIELDS = ('id', 'user_id', 'product_id', 'rating', 'comment', 'created_at', 'username')
+    __slots__ = FIELDS
+
+    def to_dict(self):
+        result = super().to_dict()
+        result['created_at'] = self.created_at.isoformat() if self.created_at else None
+        return result
+
+    def sort_key(self, sort):
+        return [getattr(self, name) for name, _ in REVIEW_SORTS[sort]]
+
+
+class UserListing(ReadModel):
+    FIELDS = ('id', 'username', 'user_type', 'farm_name')
+    __slots__ = FIELDS + ('sort_name',)
+
+    def to_dict(self):
+        result = super().to_dict()
+        if self.user_type != 'farmer':
+            result['farm_name'] = None
+        return result
+
+
+def products_query(category=None, farmer_id=None, search=None, geohash_prefixes=None):
+    """
+    Catalog rows with their farmer's name, in ProductListing slot order.
+    geohash_prefixes restricts to farmers located in those cells (an empty
+    list means any located farmer).
+    """
+    stmt = select(
+        Product.id, Product.name, Product.description, Product.price, Product.category,
+        Product.quantity, Product.image_url, Product.farmer_id, User.username, User.farm_name,
+        User.latitude, User.longitude
+    ).join(User, User.id == Product.farmer_id)
+
+    if category:
+        stmt = stmt.where(Product.category == category)
+    if farmer_id:
+        stmt = stmt.where(Product.farmer_id == farmer_id)
+    if search:
+        stmt = stmt.where(Product.name.ilike(f'%{search}%'))
+    if geohash_prefixes is not None:
+        # Range comparisons keep the geohash index usable on every backend
+        stmt = stmt.where(User.geohash.isnot(None))
+        if geohash_prefixes:
+            stmt = stmt.where(or_(*[
+                and_(User.geohash >= prefix, User.geohash < prefix + '~') for prefix in geohash_prefixes
+            ]))
+    return stmt
+
+
+def load_products(category=None, farmer_id=None, search=None, geohash_prefixes=None):
+    return ProductListing.from_rows(db.session.execute(
+        products_query(category, farmer_id, search, geohash_prefixes)
+    ))
+
+
+def load_orders(buyer_id=None, farmer_id=None):
+    """
+    Orders placed by a buyer, or containing any of a farmer's products, each
+    with all of its items. Two queries regardless of the number of orders.
+    """
+    stmt = select(
+        Order.id, Order.buyer_id, User.username, Order.total_amount, Order.status,
+        Order.created_at, Order.mpesa_receipt
+    ).join(User, User.id == Order.buyer_id).order_by(Order.id)
+
+    if buyer_id is not None:
+        stmt = stmt.where(Order.buyer_id == buyer_id)
+    if farmer_id is not None:
+        stmt = stmt.where(Order.id.in_(
+            select(OrderItem.order_id).join(Product, Product.id == OrderItem.product_id)
+            .where(Product.farmer_id == farmer_id)
+        ))
+
+    orders = [OrderListing(*row, []) for row in db.session.execute(stmt)]
+    if not orders:
+        return orders
+
+    by_id = {order.id: order for order in orders}
+    items = db.session.execute(
+        select(
+            OrderItem.id, OrderItem.product_id, Product.name, OrderItem.quantity,
+            OrderItem.price, OrderItem.order_id
+        ).join(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id.in_(stmt.with_only_columns(Order.id).order_by(None)))
+        .order_by(OrderItem.id)
+    )
+    for item in OrderItemListing.from_rows(items):
+        by_id[item.order_id].items.append(item)
+    return orders
+
+
+def _keyset_after(columns, descending, values):
+    """
+    Rows after values in the order given by columns and their directions.
+    Runs of columns sharing a direction compare as one row value, e.g.
+    rating > :r OR (rating = :r AND (created_at, id) < (:c, :i)).
+    """
+    # Typed literals so datetimes bind in the column's storage format
+    bounds = [literal(value, column.type) for column, value in zip(columns, values)]
+    end = 1
+    while end < len(columns) and descending[end] == descending[0]:
+        end += 1
+    head, bound = tuple_(*columns[:end]), tuple_(*bounds[:end])
+    after = head < bound if descending[0] else head > bound
+    if end == len(columns):
+        return after
+    return or_(after, and_(
+        *[column == value for column, value in zip(columns[:end], bounds[:end])],
+        _keyset_after(columns[end:], descending[end:], values[end:])
+    ))
+
+
+def load_reviews(product_id=None, sort='newest', after=None, limit=None):
+    """
+    One page of reviews with their authors' usernames, in REVIEW_SORTS order.
+    after is the sort key of the previous page's last row (see
+    ReviewListing.sort_key); a malformed one raises InvalidCursor.
+    """
+    keys = REVIEW_SORTS[sort]
+    columns = [getattr(Review, name) for name, _ in keys]
+    stmt = select(
+        Review.id, Review.user_id, Review.product_id, Review.rating, Review.comment,
+        Review.created_at, User.username
+    ).join(User, User.id == Review.user_id)
+
+    if product_id:
+        stmt = stmt.where(Review.product_id == product_id)
+    if after is not None:
+        if len(after) != len(keys) or not all(
+            isinstance(value, _REVIEW_KEY_TYPES[name]) and not isinstance(value, bool)
+            for (name, _), value in zip(keys, after)
+        ):
+            raise InvalidCursor('Invalid cursor')
+        stmt = stmt.where(_keyset_after(
+            columns, [descending for _, descending in keys], after
+        ))
+
+    stmt = stmt.order_by(*[
+        column.desc() if descending else column.asc()
+        for column, (_, descending) in zip(columns, keys)
+    ])
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return ReviewListing.from_rows(db.session.execute(stmt))
+
+
+def load_user_directory(user_type=None, prefix=None, after=None, limit=None, exclude_id=None):
+    """
+    One page of users ordered by lower(username), id, limited to user_type
+    or, without one, to every DIRECTORY_USER_TYPES type (never admins).
+    prefix matches the start of the username, or of the farm name for
+    farmers, ignoring case. after is the previous page's last (sort_name, id).
+    """
+    dialect_name = db.session.get_bind().dialect.name
+    sort_name = func.lower(User.username)
+    stmt = select(User.id, User.username, User.user_type, User.farm_name, sort_name)
+
+    if user_type:
+        stmt = stmt.where(User.user_type == user_type)
+    else:
+        stmt = stmt.where(User.user_type.in_(DIRECTORY_USER_TYPES))
+    if exclude_id is not None:
+        stmt = stmt.where(User.id != exclude_id)
+    if prefix:
+        prefix = fold_case(prefix, dialect_name)
+        stmt = stmt.where(or_(
+            prefix_match(sort_name, prefix, dialect_name),
+            and_(User.user_type == 'farmer', prefix_match(func.lower(User.farm_name), prefix, dialect_name))
+        ))
+    if after is not None:
+        if len(after) != 2 or not isinstance(after[0], str) or not isinstance(after[1], int):
+            raise InvalidCursor('Invalid cursor')
+        stmt = stmt.where(tuple_(sort_name, User.id) > tuple_(literal(after[0]), literal(after[1])))
+
+    stmt = stmt.order_by(sort_name, User.id)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+
+    return UserListing.from_rows(db.session.execute(stmt))
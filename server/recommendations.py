@@ -0,0 +1,206 @@
+# recommendations.py
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import delete, exists, select
+
+from models import db, Order, OrderItem, ProductCooccurrence, ProductRecommendation, RecommendationOrder
+from sqlutil import dialect_insert
+
+EXCLUDED_STATUSES = ('cancelled',)
+
+
+def cooccurrence_counts(order_ids, product_ids):
+    """
+    Count, for every product pair, how many orders contain both. Returns
+    (product, other_product, count) arrays in both directions, with the
+    diagonal holding the number of orders per product.
+    """
+    import numpy as np
+
+    pairs = np.unique(np.column_stack([order_ids, product_ids]).astype(np.int64), axis=0)
+    if not len(pairs):
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    orders, products = pairs[:, 0], pairs[:, 1]
+
+    # For each item, pair it with itself and every later item in its order
+    starts = np.r_[0, np.flatnonzero(np.diff(orders)) + 1]
+    ends = np.r_[starts[1:], len(orders)]
+    positions = np.arange(len(orders))
+    partners = np.repeat(ends, ends - starts) - positions
+    left = np.repeat(positions, partners)
+    right = left + np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+
+    a, b = products[left], products[right]
+    off_diagonal = a != b
+    both = np.column_stack([
+        np.concatenate([a, b[off_diagonal]]),
+        np.concatenate([b, a[off_diagonal]])
+    ])
+    keys, counts = np.unique(both, axis=0, return_counts=True)
+    return keys[:, 0], keys[:, 1], counts
+
+
+def top_k(products, others, counts, k):
+    """
+    Score pairs by cosine similarity of their order sets and keep the best k
+    per product. Returns (product, rank, other_product, score) arrays.
+    """
+    import numpy as np
+
+    products = np.asarray(products, dtype=np.int64)
+    others = np.asarray(others, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.float64)
+
+    diagonal = products == others
+    totals_ids = products[diagonal]
+    totals = counts[diagonal]
+    sort = np.argsort(totals_ids)
+    totals_ids, totals = totals_ids[sort], totals[sort]
+
+    products, others, counts = products[~diagonal], others[~diagonal], counts[~diagonal]
+    empty = np.empty(0, dtype=np.int64)
+    if not len(products):
+        return empty, empty, empty, np.empty(0)
+
+    n_product = totals[np.searchsorted(totals_ids, products)]
+    n_other = totals[np.searchsorted(totals_ids, others)]
+    scores = counts / np.sqrt(n_product * n_other)
+
+    # Group by product, best score first (ties broken by product id)
+    order = np.lexsort((others, -scores, products))
+    products, others, scores = products[order], others[order], scores[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(products)) + 1]
+    ranks = np.arange(len(products)) - np.repeat(starts, np.diff(np.r_[starts, len(products)]))
+
+    keep = ranks < k
+    return products[keep], ranks[keep], others[keep], scores[keep]
+
+
+def _order_items(*where):
+    rows = db.session.execute(
+        select(OrderItem.order_id, OrderItem.product_id)
+        .join(Order, Order.id == OrderItem.order_id)
+        .where(*where)
+        .order_by(OrderItem.order_id)
+    ).all()
+    return [r[0] for r in rows], [r[1] for r in rows]
+
+
+def _uncounted_order_items():
+    # Every live order not counted yet, whatever its id, so an order that
+    # commits after a later one isn't skipped
+    counted = exists().where(RecommendationOrder.order_id == Order.id)
+    return _order_items(Order.status.notin_(EXCLUDED_STATUSES), ~counted)
+
+
+def _cancelled_order_items():
+    # Counted orders that have since been cancelled
+    return _order_items(
+        Order.status.in_(EXCLUDED_STATUSES),
+        Order.id.in_(select(RecommendationOrder.order_id))
+    )
+
+
+def _add_counts(products, others, counts):
+    if not len(products):
+        return
+    insert = dialect_insert(db.engine.dialect.name)
+    stmt = insert(ProductCooccurrence.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['product_id', 'other_product_id'],
+        set_={'count': ProductCooccurrence.__table__.c.count + stmt.excluded['count']}
+    )
+    db.session.execute(stmt, [
+        {'product_id': int(p), 'other_product_id': int(o), 'count': int(c)}
+        for p, o, c in zip(products, others, counts)
+    ])
+
+
+def _store_recommendations(product_ids, k):
+    # Every pair touching these products, plus the order totals their
+    # partners need for scoring
+    rows = db.session.execute(
+        select(ProductCooccurrence.product_id, ProductCooccurrence.other_product_id, ProductCooccurrence.count)
+        .where(ProductCooccurrence.product_id.in_(product_ids))
+    ).all()
+    partner_ids = {r[1] for r in rows} - set(product_ids)
+    if partner_ids:
+        rows += db.session.execute(
+            select(ProductCooccurrence.product_id, ProductCooccurrence.other_product_id, ProductCooccurrence.count)
+            .where(
+                ProductCooccurrence.product_id.in_(partner_ids),
+                ProductCooccurrence.product_id == ProductCooccurrence.other_product_id
+            )
+        ).all()
+
+    products, ranks, others, scores = top_k(
+        [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], k
+    )
+
+    db.session.execute(delete(ProductRecommendation).where(ProductRecommendation.product_id.in_(product_ids)))
+    if len(products):
+        db.session.execute(ProductRecommendation.__table__.insert(), [
+            {'product_id': int(p), 'rank': int(r), 'related_product_id': int(o), 'score': float(s)}
+            for p, r, o, s in zip(products, ranks, others, scores)
+        ])
+
+
+def refresh_recommendations(full=False, k=None):
+    """
+    Fold orders not counted yet into the co-occurrence counts, take back
+    counted orders that were cancelled since, and recompute top-K
+    neighbours for every product whose scores changed. With full=True the
+    counts are rebuilt from scratch. Returns the number of orders processed.
+    """
+    k = k or current_app.config['RECOMMENDATIONS_TOP_K']
+    if full:
+        db.session.execute(delete(ProductRecommendation))
+        db.session.execute(delete(ProductCooccurrence))
+        db.session.execute(delete(RecommendationOrder))
+
+    order_ids, product_ids = _uncounted_order_items()
+    cancelled_ids, cancelled_product_ids = _cancelled_order_items()
+    if not order_ids and not cancelled_ids:
+        db.session.commit()
+        return 0
+
+    products, others, counts = cooccurrence_counts(order_ids, product_ids)
+    _add_counts(products, others, counts)
+    if order_ids:
+        db.session.execute(RecommendationOrder.__table__.insert(), [
+            {'order_id': order_id} for order_id in set(order_ids)
+        ])
+
+    if cancelled_ids:
+        removed = cooccurrence_counts(cancelled_ids, cancelled_product_ids)
+        _add_counts(removed[0], removed[1], -removed[2])
+        db.session.execute(delete(ProductCooccurrence).where(ProductCooccurrence.count <= 0))
+        db.session.execute(delete(RecommendationOrder).where(RecommendationOrder.order_id.in_(set(cancelled_ids))))
+        products = list(products) + list(removed[0])
+
+    # A product's scores change when its own counts do or when a partner's
+    # order total does, so both sides of every touched pair are recomputed
+    touched = {int(p) for p in products}
+    touched |= set(db.session.execute(
+        select(ProductCooccurrence.other_product_id)
+        .where(ProductCooccurrence.product_id.in_(touched))
+    ).scalars())
+    touched = sorted(touched)
+
+    batch_size = current_app.config['RECOMMENDATIONS_BATCH_SIZE']
+    for i in range(0, len(touched), batch_size):
+        _store_recommendations(touched[i:i + batch_size], k)
+
+    db.session.commit()
+    return len(set(order_ids) | set(cancelled_ids))
+
+
+@click.command('refresh-recommendations')
+@click.option('--full', is_flag=True, help='Rebuild counts from every order instead of changed ones only.')
+@with_appcontext
+def refresh_recommendations_command(full):
+    """Update "frequently bought together" recommendations."""
+    processed = refresh_recommendations(full=full)
+    click.echo(f'Processed {processed} orders')
@@ -0,0 +1,1210 @@
+from flask import Blueprint, current_app, request, jsonify, send_from_directory, send_file, abort, g
+from models import db, User, Product, Order, OrderItem, ChatMessage, Review, ProductRecommendation, InventoryHold
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from geo import covering_prefixes, parse_point, to_point, within_radius
+from images import InvalidImage, store_image, image_url, image_url_for, resolve_image
+from bulk_import import BulkFormatError, build_upsert, detect_format, iter_rows, validate_row
+from batch import InvalidSubrequest, run_batch, validate_subrequests
+from metrics import metrics
+from market import BUCKETS, price_index, price_index_cache
+from profiler import ProfilerBusy
+from read_models import DIRECTORY_USER_TYPES, REVIEW_SORTS, load_orders, load_products, load_reviews, load_user_directory
+from pagination import InvalidCursor, decode_cursor, encode_cursor, page_limit
+from outbox import record_order_status
+from holds import EmptyCart, InsufficientStock, available_quantity, checkout, release_hold, set_hold, take_stock
+from chat_search import search_messages
+
+import jwt
+import datetime
+import math
+import os
+import time
+from functools import wraps
+
+api = Blueprint('api', __name__)
+
+# JWT authentication decorator
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        # Sub-requests of /api/batch reuse the batch's authenticated user
+        batch_user = g.get('batch_user')
+        if batch_user is not None:
+            return f(batch_user, *args, **kwargs)
+        
+        token = request.headers.get('Authorization')
+        if not token:
+            return jsonify({'message': 'Token is missing!'}), 401
+        
+        try:
+            current_user = User.query.get(token_user_id(token))
+        except:
+            return jsonify({'message': 'Token is invalid!'}), 401
+            
+        return f(current_user, *args, **kwargs)
+        
+    return decorated
+
+# User id from an Authorization header; raises if the token is malformed,
+# expired or forged. Shared with the async views
+def token_user_id(token):
+    data = jwt.decode(token.split()[1], current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    return data['user_id']
+
+# Restrict a token_required route to admin accounts
+def admin_required(f):
+    @wraps(f)
+    def decorated(current_user, *args, **kwargs):
+        if current_user.user_type != 'admin':
+            return jsonify({'message': 'Admin access required'}), 403
+        return f(current_user, *args, **kwargs)
+        
+    return decorated
+
+# User Registration
+@api.route('/api/register', methods=['POST'])
+def register():
+    data = request.get_json()
+    
+    # Admin accounts are provisioned directly, never self-registered
+    if data['user_type'] not in ('farmer', 'buyer'):
+        return jsonify({'message': 'user_type must be farmer or buyer'}), 400
+    
+    if User.query.filter_by(username=data['username']).first():
+        return jsonify({'message': 'Username already exists'}), 400
+        
+    if User.query.filter_by(email=data['email']).first():
+        return jsonify({'message': 'Email already exists'}), 400
+        
+    user = User(
+        username=data['username'],
+        email=data['email'],
+        user_type=data['user_type']
+    )
+    
+    if data['user_type'] == 'farmer':
+        user.farm_name = data.get('farm_name')
+        user.location = data.get('location')
+        
+        if data.get('latitude') is not None and data.get('longitude') is not None:
+            try:
+                user.set_coordinates(*to_point(data['latitude'], data['longitude']))
+            except ValueError:
+                return jsonify({'message': 'Invalid latitude/longitude'}), 400
+    
+    user.set_password(data['password'])
+    
+    db.session.add(user)
+    db.session.commit()
+    
+    token = jwt.encode({
+        'user_id': user.id,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+    }, current_app.config['SECRET_KEY'])
+    
+    return jsonify({
+        'token': token,
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'user_type': user.user_type,
+            'farm_name': user.farm_name,
+            'location': user.location,
+            'latitude': user.latitude,
+            'longitude': user.longitude
+        }
+    }), 201
+
+# User Login
+@api.route('/api/login', methods=['POST'])
+def login():
+    data = request.get_json()
+    user = User.query.filter_by(username=data['username']).first()
+    
+    if not user or not user.check_password(data['password']):
+        return jsonify({'message': 'Invalid credentials'}), 401
+        
+    token = jwt.encode({
+        'user_id': user.id,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+    }, current_app.config['SECRET_KEY'])
+    
+    return jsonify({
+        'token': token,
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'user_type': user.user_type,
+            'farm_name': user.farm_name,
+            'location': user.location,
+            'latitude': user.latitude,
+            'longitude': user.longitude
+        }
+    }), 200
+
+# Catalog filters from the query string, shared with the async views.
+# Returns (filters, None), or (None, error response)
+def parse_product_filters():
+    filters = {
+        'category': request.args.get('category'),
+        'farmer_id': request.args.get('farmer_id'),
+        'search': request.args.get('search'),
+        'size': request.args.get('size'),
+        'near': None,
+        'prefixes': None
+    }
+    if filters['size'] not in current_app.config['IMAGE_THUMBNAIL_SIZES']:
+        filters['size'] = None
+    if filters['farmer_id']:
+        try:
+            filters['farmer_id'] = int(filters['farmer_id'])
+        except ValueError:
+            return None, (jsonify({'message': 'farmer_id must be an integer'}), 400)
+    
+    near = request.args.get('near')
+    if near:
+        try:
+            lat, lng = parse_point(near)
+        except ValueError:
+            return None, (jsonify({'message': 'near must be "lat,lng"'}), 400)
+        
+        radius_km = request.args.get('radius_km', current_app.config['NEAR_DEFAULT_RADIUS_KM'], type=float)
+        if not 0 < radius_km <= current_app.config['NEAR_MAX_RADIUS_KM']:
+            return None, (jsonify({'message': f"radius_km must be between 0 and {current_app.config['NEAR_MAX_RADIUS_KM']}"}), 400)
+        
+        # Prune to farmers in the surrounding geohash cells
+        filters['near'] = (lat, lng, radius_km)
+        filters['prefixes'] = covering_prefixes(lat, lng, radius_km)
+    
+    return filters, None
+
+# Catalog response for the rows loaded with the given filters
+def product_listing_response(products, filters):
+    distances = None
+    
+    if filters['near']:
+        # Exact distance check over the candidate set, nearest first
+        lat, lng, radius_km = filters['near']
+        keep, distances = within_radius(
+            lat, lng, radius_km,
+            [p.latitude for p in products],
+            [p.longitude for p in products]
+        )
+        products = [products[i] for i in keep]
+    
+    result = [p.to_dict() for p in products]
+    if filters['size']:
+        for item in result:
+            item['image_url'] = image_url_for(item['image_url'], filters['size'])
+    
+    if distances is not None:
+        for item, distance in zip(result, distances):
+            item['distance_km'] = round(distance, 2)
+    
+    return jsonify(result), 200
+
+# Get all products with filtering
+@api.route('/api/products', methods=['GET'])
+def get_products():
+    filters, error = parse_product_filters()
+    if error is not None:
+        return error
+    
+    products = load_products(filters['category'], filters['farmer_id'], filters['search'], filters['prefixes'])
+    return product_listing_response(products, filters)
+
+# Create a new product
+@api.route('/api/products', methods=['POST'])
+@token_required
+def create_product(current_user):
+    if current_user.user_type != 'farmer':
+        return jsonify({'message': 'Only farmers can create products'}), 403
+        
+    data = request.get_json()
+    
+    product = Product(
+        name=data['name'],
+        description=data.get('description', ''),
+        price=data['price'],
+        category=data.get('category', ''),
+        quantity=data.get('quantity', 0),
+        image_url=data.get('image_url', ''),
+        farmer_id=current_user.id
+    )
+    
+    db.session.add(product)
+    db.session.commit()
+    
+    return jsonify({
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category,
+        'quantity': product.quantity,
+        'image_url': product.image_url,
+        'farmer_id': product.farmer_id
+    }), 201
+
+# Bulk create/update products from a CSV or NDJSON upload
+@api.route('/api/products/bulk', methods=['POST'])
+@token_required
+def bulk_upsert_products(current_user):
+    if current_user.user_type != 'farmer':
+        return jsonify({'message': 'Only farmers can import products'}), 403
+        
+    fmt = detect_format(request.mimetype)
+    if not fmt:
+        return jsonify({'message': 'Content-Type must be text/csv or application/x-ndjson'}), 415
+        
+    chunk_size = current_app.config['BULK_IMPORT_CHUNK_SIZE']
+    max_errors = current_app.config['BULK_IMPORT_MAX_ERRORS']
+    upsert = build_upsert(Product.__table__, db.engine.dialect.name)
+    
+    processed = 0
+    duplicates = 0
+    failed = 0
+    errors = []
+    seen_skus = set()
+    # Keyed by sku so a repeated sku within a chunk keeps its last row;
+    # ON CONFLICT cannot touch the same row twice in one statement
+    chunk = {}
+    
+    def flush():
+        if chunk:
+            db.session.execute(upsert, list(chunk.values()))
+            chunk.clear()
+    
+    try:
+        for row_number, row, error in iter_rows(request.stream, fmt):
+            if error:
+                values, row_errors = None, [error]
+            else:
+                values, row_errors = validate_row(row, current_user.id)
+                
+            if row_errors:
+                failed += 1
+                if len(errors) < max_errors:
+                    errors.append({'row': row_number, 'errors': row_errors})
+                continue
+                
+            processed += 1
+            # A repeated sku updates the same product again; the last row wins
+            if values['sku'] in seen_skus:
+                duplicates += 1
+            seen_skus.add(values['sku'])
+            chunk.pop(values['sku'], None)
+            chunk[values['sku']] = values
+            if len(chunk) >= chunk_size:
+                flush()
+        flush()
+        db.session.commit()
+    except (BulkFormatError, UnicodeDecodeError) as e:
+        db.session.rollback()
+        return jsonify({'message': f'Could not parse upload: {e}'}), 400
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return jsonify({
+        'processed': processed,
+        'duplicates': duplicates,
+        'failed': failed,
+        'errors': errors,
+        'errors_truncated': failed > len(errors)
+    }), 200
+
+# Product detail payload; the farmer relationship must be loaded
+def product_detail(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category,
+        'quantity': product.quantity,
+        'available_quantity': available_quantity(product),
+        'image_url': product.image_url,
+        'farmer_id': product.farmer_id,
+        'farmer_name': product.farmer.username,
+        'farm_name': product.farmer.farm_name
+    }
+
+# Get a specific product
+@api.route('/api/products/<int:product_id>', methods=['GET'])
+def get_product(product_id):
+    product = Product.query.get_or_404(product_id)
+    
+    return jsonify(product_detail(product)), 200
+
+# Get products frequently bought together with this one
+@api.route('/api/products/<int:product_id>/recommendations', methods=['GET'])
+def get_product_recommendations(product_id):
+    Product.query.get_or_404(product_id)
+    max_k = current_app.config['RECOMMENDATIONS_TOP_K']
+    limit = max(1, min(request.args.get('limit', max_k, type=int), max_k))
+    
+    # Precomputed by `flask refresh-recommendations`; a primary-key range scan
+    recommendations = ProductRecommendation.query.filter_by(product_id=product_id).options(
+        joinedload(ProductRecommendation.related_product)
+    ).order_by(ProductRecommendation.rank).limit(limit).all()
+    
+    return jsonify([{
+        'id': r.related_product.id,
+        'name': r.related_product.name,
+        'price': r.related_product.price,
+        'category': r.related_product.category,
+        'image_url': r.related_product.image_url,
+        'farmer_id': r.related_product.farmer_id,
+        'score': round(r.score, 4)
+    } for r in recommendations]), 200
+
+# Market price index from transacted order prices
+@api.route('/api/market/prices', methods=['GET'])
+def get_market_prices():
+    bucket = request.args.get('bucket', 'week')
+    if bucket not in BUCKETS:
+        return jsonify({'message': f"bucket must be one of {', '.join(BUCKETS)}"}), 400
+        
+    max_days = current_app.config['MARKET_PRICE_MAX_WINDOW_DAYS']
+    days = request.args.get('days', current_app.config['MARKET_PRICE_WINDOW_DAYS'], type=int)
+    days = max(1, min(days, max_days))
+    category = request.args.get('category')
+    name = request.args.get('name')
+    
+    # The newest order id and update time version the cache, so results are
+    # reused until orders arrive or change status (a cancellation drops its
+    # prices); the date keeps the window sliding daily
+    version = tuple(db.session.execute(select(func.max(Order.id), func.max(Order.updated_at))).one())
+    key = (bucket, days, category, name, datetime.datetime.utcnow().date())
+    result = price_index_cache.get(key, version)
+    
+    if result is None:
+        since = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+        stmt = select(Product.category, Product.name, OrderItem.price, Order.created_at).select_from(OrderItem).join(
+            Order, Order.id == OrderItem.order_id
+        ).join(
+            Product, Product.id == OrderItem.product_id
+        ).where(Order.created_at >= since, Order.status != 'cancelled')
+        if category:
+            stmt = stmt.where(Product.category == category)
+        if name:
+            stmt = stmt.where(Product.name == name)
+            
+        rows = db.session.execute(stmt).all()
+        columns = list(zip(*rows)) if rows else ([], [], [], [])
+        result = price_index(*columns, bucket=bucket)
+        result['window_days'] = days
+        price_index_cache.put(key, version, result)
+    
+    return jsonify(result), 200
+
+# Update a product
+@api.route('/api/products/<int:product_id>', methods=['PUT'])
+@token_required
+def update_product(current_user, product_id):
+    product = Product.query.get_or_404(product_id)
+    
+    if product.farmer_id != current_user.id:
+        return jsonify({'message': 'You can only update your own products'}), 403
+        
+    data = request.get_json()
+    
+    if 'name' in data:
+        product.name = data['name']
+    if 'description' in data:
+        product.description = data['description']
+    if 'price' in data:
+        product.price = data['price']
+    if 'category' in data:
+        product.category = data['category']
+    if 'quantity' in data:
+        product.quantity = data['quantity']
+    if 'image_url' in data:
+        product.image_url = data['image_url']
+        
+    db.session.commit()
+    
+    return jsonify({
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'category': product.category,
+        'quantity': product.quantity,
+        'image_url': product.image_url,
+        'farmer_id': product.farmer_id
+    }), 200
+
+# Delete a product
+@api.route('/api/products/<int:product_id>', methods=['DELETE'])
+@token_required
+def delete_product(current_user, product_id):
+    product = Product.query.get_or_404(product_id)
+    
+    if product.farmer_id != current_user.id:
+        return jsonify({'message': 'You can only delete your own products'}), 403
+        
+    # Cart holds on a deleted product have nothing left to reserve
+    db.session.execute(delete(InventoryHold).where(InventoryHold.product_id == product.id))
+    db.session.delete(product)
+    db.session.commit()
+    
+    return jsonify({'message': 'Product deleted successfully'}), 200
+
+# Upload a product image
+@api.route('/api/images', methods=['POST'])
+@token_required
+def upload_image(current_user):
+    if current_user.user_type != 'farmer':
+        return jsonify({'message': 'Only farmers can upload product images'}), 403
+        
+    upload = request.files.get('image')
+    if not upload:
+        return jsonify({'message': 'No image provided'}), 400
+        
+    data = upload.read(current_app.config['IMAGE_MAX_BYTES'] + 1)
+    if len(data) > current_app.config['IMAGE_MAX_BYTES']:
+        return jsonify({'message': 'Image is too large'}), 413
+        
+    try:
+        digest, ext, created = store_image(
+            data,
+            current_app.config['IMAGE_UPLOAD_FOLDER'],
+            current_app.config['IMAGE_THUMBNAIL_SIZES'],
+            current_app.config['IMAGE_THUMBNAIL_WORKERS'],
+            current_app.config['IMAGE_MAX_PIXELS']
+        )
+    except InvalidImage as e:
+        return jsonify({'message': str(e)}), 400
+        
+    return jsonify({
+        'hash': digest,
+        'image_url': image_url(digest, ext),
+        'thumbnails': {size: image_url(digest, ext, size) for size in current_app.config['IMAGE_THUMBNAIL_SIZES']}
+    }), 201 if created else 200
+
+# Serve an uploaded image or one of its thumbnails
+@api.route('/api/images/<filename>', methods=['GET'])
+def get_image(filename):
+    resolved = resolve_image(current_app.config['IMAGE_UPLOAD_FOLDER'], filename)
+    if not resolved:
+        abort(404)
+        
+    directory, name, is_final = resolved
+    if not is_final:
+        # Thumbnail not generated yet; serve the original without caching
+        return send_from_directory(directory, name)
+        
+    # Content-addressed, so the bytes behind a URL never change
+    response = send_from_directory(directory, name, max_age=current_app.config['IMAGE_CACHE_MAX_AGE'])
+    response.cache_control.immutable = True
+    return response
+
+# Create an order
+@api.route('/api/orders', methods=['POST'])
+@token_required
+def create_order(current_user):
+    # Both buyers and farmers can place orders
+    # (farmers might want to buy from other farmers)
+    if current_user.user_type not in ['buyer', 'farmer']:
+        return jsonify({'message': 'Invalid user type for placing orders'}), 403
+        
+    data = request.get_json()
+    
+    # Calculate total amount
+    total_amount = 0
+    order_items = []
+    
+    for item in data['items']:
+        product = Product.query.get(item['product_id'])
+        if not product:
+            db.session.rollback()
+            return jsonify({'message': f"Product {item['product_id']} not found"}), 404
+            
+        # Reduce product quantity in a single conditional UPDATE, so
+        # concurrent orders can't oversell; stock held in other buyers'
+        # carts isn't for sale
+        if not take_stock(product.id, item['quantity']):
+            message = f"Insufficient quantity for {product.name}"
+            db.session.rollback()
+            return jsonify({'message': message}), 400
+            
+        total_amount += product.price * item['quantity']
+        
+        order_items.append(OrderItem(
+            product_id=item['product_id'],
+            quantity=item['quantity'],
+            price=product.price
+        ))
+    
+    # Create order
+    order = Order(
+        buyer_id=current_user.id,
+        total_amount=total_amount,
+        phone_number=data['phone_number']
+    )
+    
+    for item in order_items:
+        order.items.append(item)
+    
+    db.session.add(order)
+    db.session.commit()
+    
+    # For now, skip M-Pesa integration and mark order as pending
+    order.status = 'pending'
+    
+    return jsonify({
+        'order_id': order.id,
+        'message': 'Order placed successfully',
+        'status': order.status,
+        'total_amount': total_amount
+    }), 201
+
+# Get the current user's cart (live inventory holds)
+@api.route('/api/cart', methods=['GET'])
+@token_required
+def get_cart(current_user):
+    holds = db.session.execute(
+        select(InventoryHold, Product.name, Product.price)
+        .join(Product, Product.id == InventoryHold.product_id)
+        .where(InventoryHold.user_id == current_user.id, InventoryHold.expires_at > datetime.datetime.utcnow())
+        .order_by(InventoryHold.id)
+    ).all()
+    
+    items = [{
+        'product_id': hold.product_id,
+        'product_name': name,
+        'price': price,
+        'quantity': hold.quantity,
+        'expires_at': hold.expires_at.isoformat()
+    } for hold, name, price in holds]
+    
+    return jsonify({
+        'items': items,
+        'total_amount': sum(item['price'] * item['quantity'] for item in items)
+    }), 200
+
+# Hold stock for a cart item; quantity replaces any existing hold and
+# restarts its expiry, 0 removes it
+@api.route('/api/cart/<int:product_id>', methods=['PUT'])
+@token_required
+def put_cart_item(current_user, product_id):
+    if current_user.user_type not in ['buyer', 'farmer']:
+        return jsonify({'message': 'Invalid user type for placing orders'}), 403
+    
+    data = request.get_json() or {}
+    quantity = data.get('quantity')
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+        return jsonify({'message': 'quantity must be a non-negative integer'}), 400
+    
+    if db.session.get(Product, product_id) is None:
+        return jsonify({'message': f'Product {product_id} not found'}), 404
+    
+    ttl = current_app.config['CART_HOLD_TTL_SECONDS']
+    try:
+        hold = set_hold(current_user.id, product_id, quantity, ttl)
+        db.session.commit()
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'available_quantity': e.available}), 409
+    except IntegrityError:
+        # A concurrent request created the same hold first
+        db.session.rollback()
+        return jsonify({'message': 'Cart was modified concurrently, please retry'}), 409
+    
+    if hold is None:
+        return jsonify({'message': 'Item removed from cart'}), 200
+    
+    current_app.extensions['hold_sweeper'].schedule(ttl)
+    return jsonify({
+        'product_id': hold.product_id,
+        'quantity': hold.quantity,
+        'expires_at': hold.expires_at.isoformat()
+    }), 200
+
+# Remove a cart item, releasing its held stock
+@api.route('/api/cart/<int:product_id>', methods=['DELETE'])
+@token_required
+def delete_cart_item(current_user, product_id):
+    if not release_hold(current_user.id, product_id):
+        return jsonify({'message': 'Item not in cart'}), 404
+    db.session.commit()
+    
+    return jsonify({'message': 'Item removed from cart'}), 200
+
+# Place an order for everything held in the cart
+@api.route('/api/cart/checkout', methods=['POST'])
+@token_required
+def checkout_cart(current_user):
+    data = request.get_json() or {}
+    if not data.get('phone_number'):
+        return jsonify({'message': 'phone_number is required'}), 400
+    
+    try:
+        order, expired = checkout(current_user.id, data['phone_number'])
+        db.session.commit()
+    except EmptyCart as e:
+        # Lapsed holds were released above; keep that
+        db.session.commit()
+        return jsonify({'message': str(e)}), 400
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({'message': str(e), 'product_id': e.product_id}), 409
+    
+    return jsonify({
+        'order_id': order.id,
+        'message': 'Order placed successfully',
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'expired_product_ids': expired
+    }), 201
+
+# Get orders
+@api.route('/api/orders', methods=['GET'])
+@token_required
+def get_orders(current_user):
+    if current_user.user_type == 'farmer':
+        # Farmers see orders for their products
+        orders = load_orders(farmer_id=current_user.id)
+    else:
+        # Buyers see their own orders
+        orders = load_orders(buyer_id=current_user.id)
+    
+    return jsonify([o.to_dict() for o in orders]), 200
+
+# Get a specific order
+@api.route('/api/orders/<int:order_id>', methods=['GET'])
+@token_required
+def get_order(current_user, order_id):
+    order = Order.query.get_or_404(order_id)
+    
+    # Check if user has access to this order
+    if current_user.user_type == 'buyer' and order.buyer_id != current_user.id:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    if current_user.user_type == 'farmer':
+        # Check if any product in the order belongs to this farmer
+        farmer_products = any(item.product.farmer_id == current_user.id for item in order.items)
+        if not farmer_products:
+            return jsonify({'message': 'Access denied'}), 403
+    
+    return jsonify({
+        'id': order.id,
+        'buyer_id': order.buyer_id,
+        'buyer_name': order.buyer.username,
+        'total_amount': order.total_amount,
+        'status': order.status,
+        'created_at': order.created_at.isoformat(),
+        'mpesa_receipt': order.mpesa_receipt,
+        'items': [{
+            'id': item.id,
+            'product_id': item.product_id,
+            'product_name': item.product.name,
+            'quantity': item.quantity,
+            'price': item.price,
+            'farmer_id': item.product.farmer_id,
+            'farmer_name': item.product.farmer.username
+        } for item in order.items]
+    }), 200
+
+# Update order status
+@api.route('/api/orders/<int:order_id>', methods=['PUT'])
+@token_required
+def update_order(current_user, order_id):
+    order = Order.query.get_or_404(order_id)
+    
+    # Only farmers can update order status for their products
+    if current_user.user_type != 'farmer':
+        return jsonify({'message': 'Only farmers can update order status'}), 403
+        
+    # Check if any product in the order belongs to this farmer
+    farmer_products = any(item.product.farmer_id == current_user.id for item in order.items)
+    if not farmer_products:
+        return jsonify({'message': 'You can only update orders for your products'}), 403
+    
+    data = request.get_json()
+    
+    previous_status = order.status
+    if 'status' in data:
+        order.status = data['status']
+    
+    # Committed atomically with the status; delivered in the background
+    event = record_order_status(order, previous_status)
+    db.session.commit()
+    if event is not None:
+        current_app.extensions['outbox'].notify()
+    
+    return jsonify({
+        'id': order.id,
+        'status': order.status
+    }), 200
+
+# Callback metadata item value by name
+def mpesa_item(callback_metadata, name):
+    return next(item['Value'] for item in callback_metadata if item.get('Name') == name)
+
+# Order ID from an MPesa callback's account reference
+def mpesa_order_id(callback_metadata):
+    return int(mpesa_item(callback_metadata, 'AccountReference').replace('ORDER', ''))
+
+# Confirm a paid order and queue its status event. Shared with the async
+# views, which pass their session
+def confirm_mpesa_payment(order, callback_metadata, session=None):
+    previous_status = order.status
+    order.status = 'confirmed'
+    order.mpesa_receipt = mpesa_item(callback_metadata, 'MpesaReceiptNumber')
+    return record_order_status(order, previous_status, session)
+
+# MPesa callback endpoint
+@api.route('/api/mpesa-callback', methods=['POST'])
+def mpesa_callback():
+    data = request.get_json()
+    
+    # Extract order ID from account reference
+    try:
+        callback_metadata = data['Body']['stkCallback']['CallbackMetadata']['Item']
+        order_id = mpesa_order_id(callback_metadata)
+        
+        # Find the order
+        order = Order.query.get(order_id)
+        if not order:
+            return jsonify({'message': 'Order not found'}), 404
+            
+        # Update order status and MPesa receipt
+        event = confirm_mpesa_payment(order, callback_metadata)
+        db.session.commit()
+        if event is not None:
+            current_app.extensions['outbox'].notify()
+        
+        return jsonify({'message': 'Callback processed successfully'}), 200
+    except Exception as e:
+        current_app.logger.error(f"Error processing MPesa callback: {e}")
+        return jsonify({'message': 'Error processing callback'}), 400
+
+# Chat search parameters from the query string, shared with the async
+# views. Returns (search, None), or (None, error response)
+def parse_chat_search():
+    q = request.args.get('q', '').strip()
+    if not q:
+        return None, (jsonify({'message': 'q is required'}), 400)
+    if len(q) > current_app.config['CHAT_SEARCH_MAX_QUERY_LENGTH']:
+        return None, (jsonify({'message': 'q is too long'}), 400)
+    search = {
+        'q': q,
+        'other_user_id': request.args.get('with', type=int),
+        'after': None,
+        'limit': page_limit(
+            request.args.get('limit', type=int),
+            current_app.config['CHAT_SEARCH_PAGE_SIZE'],
+            current_app.config['CHAT_SEARCH_MAX_PAGE_SIZE']
+        )
+    }
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_q, cursor_other, *search['after'] = decode_cursor(cursor, 4)
+            if cursor_q != q or cursor_other != search['other_user_id']:
+                raise InvalidCursor('Cursor does not match this listing')
+        except InvalidCursor as e:
+            return None, (jsonify({'message': str(e)}), 400)
+    return search, None
+
+# Chat search response for up to limit + 1 results
+def chat_search_response(results, search):
+    next_cursor = None
+    if len(results) > search['limit']:
+        results = results[:search['limit']]
+        next_cursor = encode_cursor(search['q'], search['other_user_id'], results[-1]['score'], results[-1]['id'])
+    
+    return jsonify({
+        'results': [{key: value for key, value in result.items() if key != 'score'} for result in results],
+        'next_cursor': next_cursor
+    }), 200
+
+# Search the current user's conversations, best matches first, with
+# highlighted snippets. ?with= narrows the search to one conversation; a
+# word ending in * matches as a prefix
+@api.route('/api/chat/search', methods=['GET'])
+@token_required
+def search_chat_messages(current_user):
+    search, error = parse_chat_search()
+    if error is not None:
+        return error
+    
+    try:
+        results = search_messages(
+            current_user.id, search['q'], search['other_user_id'], search['after'], search['limit'] + 1
+        )
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+    
+    return chat_search_response(results, search)
+
+# Messages exchanged between two users, in either direction
+def conversation(user_id, other_user_id):
+    return (
+        ((ChatMessage.sender_id == user_id) & (ChatMessage.receiver_id == other_user_id)) |
+        ((ChatMessage.sender_id == other_user_id) & (ChatMessage.receiver_id == user_id))
+    )
+
+def chat_message_dict(m):
+    return {
+        'id': m.id,
+        'sender_id': m.sender_id,
+        'receiver_id': m.receiver_id,
+        'message': m.message,
+        'timestamp': m.timestamp.isoformat(),
+        'read': m.read
+    }
+
+# Chat history page from the query string as (page, limit, offset).
+# Out-of-range values fall back as in Flask-SQLAlchemy's
+# paginate(error_out=False)
+def chat_page():
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    limit = per_page if per_page >= 1 else 20
+    return page, limit, (max(page, 1) - 1) * limit
+
+# Statements for a page of a conversation, newest first, and its total
+def chat_page_statements(user_id, other_user_id, limit, offset):
+    where = conversation(user_id, other_user_id)
+    return (
+        select(ChatMessage).where(where).order_by(ChatMessage.timestamp.desc()).limit(limit).offset(offset),
+        select(func.count()).select_from(ChatMessage).where(where)
+    )
+
+def chat_page_response(messages, total, page, limit):
+    return jsonify({
+        'messages': [chat_message_dict(m) for m in messages],
+        'total': total,
+        'pages': math.ceil(total / limit),
+        'current_page': page
+    }), 200
+
+# Mark every unread message from sender_id to user_id as read
+def mark_read_statement(user_id, sender_id):
+    return update(ChatMessage).where(
+        ChatMessage.sender_id == sender_id,
+        ChatMessage.receiver_id == user_id,
+        ChatMessage.read == False
+    ).values(read=True)
+
+# Get chat messages between users
+@api.route('/api/chat/<int:other_user_id>', methods=['GET'])
+@token_required
+def get_chat_messages(current_user, other_user_id):
+    page, limit, offset = chat_page()
+    messages, total = chat_page_statements(current_user.id, other_user_id, limit, offset)
+    
+    return chat_page_response(db.session.scalars(messages).all(), db.session.scalar(total), page, limit)
+
+# Send a chat message
+@api.route('/api/chat/<int:receiver_id>', methods=['POST'])
+@token_required
+def send_chat_message(current_user, receiver_id):
+    data = request.get_json()
+    
+    # Check if receiver exists
+    receiver = User.query.get(receiver_id)
+    if not receiver:
+        return jsonify({'message': 'Receiver not found'}), 404
+        
+    chat_message = ChatMessage(
+        sender_id=current_user.id,
+        receiver_id=receiver_id,
+        message=data['message']
+    )
+    
+    db.session.add(chat_message)
+    db.session.commit()
+    
+    return jsonify(chat_message_dict(chat_message)), 201
+
+# Mark messages as read
+@api.route('/api/chat/mark-read', methods=['POST'])
+@token_required
+def mark_messages_as_read(current_user):
+    data = request.get_json()
+    sender_id = data.get('sender_id')
+    
+    # Mark all unread messages from this sender as read
+    db.session.execute(mark_read_statement(current_user.id, sender_id))
+    db.session.commit()
+    
+    return jsonify({'message': 'Messages marked as read'}), 200
+
+# User directory for the chat contact picker, a page at a time. ?type=
+# filters by user type; ?q= matches the start of a username or farm name
+@api.route('/api/users', methods=['GET'])
+@token_required
+def get_users(current_user):
+    user_type = request.args.get('type') or None
+    if user_type is not None and user_type not in DIRECTORY_USER_TYPES:
+        return jsonify({'message': f"type must be one of {', '.join(DIRECTORY_USER_TYPES)}"}), 400
+    prefix = request.args.get('q', '').strip() or None
+    limit = page_limit(
+        request.args.get('limit', type=int),
+        current_app.config['USERS_PAGE_SIZE'],
+        current_app.config['USERS_MAX_PAGE_SIZE']
+    )
+    
+    try:
+        after = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            cursor_type, cursor_prefix, *after = decode_cursor(cursor, 4)
+            if cursor_type != user_type or cursor_prefix != prefix:
+                raise InvalidCursor('Cursor does not match this listing')
+        users = load_user_directory(user_type, prefix, after, limit + 1, exclude_id=current_user.id)
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+    
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(user_type, prefix, users[-1].sort_name, users[-1].id)
+    
+    return jsonify({
+        'users': [user.to_dict() for user in users],
+        'next_cursor': next_cursor
+    }), 200
+
+# The users a chat user can talk to, as two statements whose results are
+# combined by chat_users_response
+def chat_contact_statements(user):
+    # For farmers, get buyers they've communicated with or who bought their products
+    if user.user_type == 'farmer':
+        # Get buyers who have ordered the farmer's products
+        ordered = select(User).join(Order).join(OrderItem).join(Product).where(
+            Product.farmer_id == user.id,
+            User.user_type == 'buyer'
+        ).distinct()
+        contact_type = 'buyer'
+    else:
+        # For buyers, get farmers they've communicated with or whose products they've bought
+        # Get farmers whose products the buyer has ordered
+        ordered = select(User).join(Product).join(OrderItem).join(Order).where(
+            Order.buyer_id == user.id,
+            User.user_type == 'farmer'
+        ).distinct()
+        contact_type = 'farmer'
+    
+    # Get users of that type who have sent messages to this user
+    message_senders = select(User).join(ChatMessage, User.id == ChatMessage.sender_id).where(
+        ChatMessage.receiver_id == user.id,
+        User.user_type == contact_type
+    ).distinct()
+    return ordered, message_senders
+
+def chat_users_response(ordered, message_senders):
+    # Combine and remove duplicates
+    users = list({user.id: user for user in ordered + message_senders}.values())
+    
+    return jsonify([{
+        'id': user.id,
+        'username': user.username,
+        'user_type': user.user_type,
+        'farm_name': user.farm_name if user.user_type == 'farmer' else None
+    } for user in users]), 200
+
+# Get user list for chat
+@api.route('/api/chat/users', methods=['GET'])
+@token_required
+def get_chat_users(current_user):
+    ordered, message_senders = chat_contact_statements(current_user)
+    
+    return chat_users_response(db.session.scalars(ordered).all(), db.session.scalars(message_senders).all())
+
+# Review endpoints - Full CRUD
+# Reviews a page at a time; pass next_cursor back as ?cursor= for the next one
+@api.route('/api/reviews', methods=['GET'])
+def get_reviews():
+    product_id = request.args.get('product_id', type=int)
+    sort = request.args.get('sort', 'newest')
+    if sort not in REVIEW_SORTS:
+        return jsonify({'message': f"sort must be one of {', '.join(REVIEW_SORTS)}"}), 400
+    limit = page_limit(
+        request.args.get('limit', type=int),
+        current_app.config['REVIEWS_PAGE_SIZE'],
+        current_app.config['REVIEWS_MAX_PAGE_SIZE']
+    )
+    
+    try:
+        after = None
+        cursor = request.args.get('cursor')
+        if cursor:
+            # The cursor is only valid for the listing it came from
+            cursor_sort, cursor_product_id, *after = decode_cursor(cursor, 2 + len(REVIEW_SORTS[sort]))
+            if cursor_sort != sort or cursor_product_id != product_id:
+                raise InvalidCursor('Cursor does not match this listing')
+        # One extra row tells us whether there is a next page
+        reviews = load_reviews(product_id, sort, after, limit + 1)
+    except InvalidCursor as e:
+        return jsonify({'message': str(e)}), 400
+    
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = encode_cursor(sort, product_id, *reviews[-1].sort_key(sort))
+    
+    return jsonify({
+        'reviews': [r.to_dict() for r in reviews],
+        'next_cursor': next_cursor
+    }), 200
+
+@api.route('/api/reviews', methods=['POST'])
+@token_required
+def create_review(current_user):
+    data = request.get_json()
+    
+    review = Review(
+        user_id=current_user.id,
+        product_id=data['product_id'],
+        rating=data['rating'],
+        comment=data.get('comment', '')
+    )
+    
+    db.session.add(review)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # uq_review_user_product: one review per user and product
+        db.session.rollback()
+        return jsonify({'message': 'You have already reviewed this product'}), 400
+    
+    return jsonify({
+        'id': review.id,
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at.isoformat()
+    }), 201
+
+@api.route('/api/reviews/<int:review_id>', methods=['PUT'])
+@token_required
+def update_review(current_user, review_id):
+    review = Review.query.get_or_404(review_id)
+    
+    if review.user_id != current_user.id:
+        return jsonify({'message': 'You can only update your own reviews'}), 403
+    
+    data = request.get_json()
+    
+    if 'rating' in data:
+        review.rating = data['rating']
+    if 'comment' in data:
+        review.comment = data['comment']
+    
+    db.session.commit()
+    
+    return jsonify({
+        'id': review.id,
+        'rating': review.rating,
+        'comment': review.comment
+    }), 200
+
+@api.route('/api/reviews/<int:review_id>', methods=['DELETE'])
+@token_required
+def delete_review(current_user, review_id):
+    review = Review.query.get_or_404(review_id)
+    
+    if review.user_id != current_user.id:
+        return jsonify({'message': 'You can only delete your own reviews'}), 403
+    
+    db.session.delete(review)
+    db.session.commit()
+    
+    return jsonify({'message': 'Review deleted successfully'}), 200
+
+# Dispatch several API calls in one round trip
+@api.route('/api/batch', methods=['POST'])
+@token_required
+def batch(current_user):
+    data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object with a requests list'}), 400
+    
+    try:
+        subrequests = validate_subrequests(data.get('requests'), current_app.config['BATCH_MAX_REQUESTS'])
+    except InvalidSubrequest as e:
+        return jsonify({'message': str(e)}), 400
+    
+    started = time.perf_counter()
+    responses = run_batch(
+        current_app._get_current_object(),
+        current_user,
+        subrequests,
+        headers={'Authorization': request.headers.get('Authorization')},
+        parallel=bool(data.get('parallel')),
+        workers=current_app.config['BATCH_THREAD_WORKERS']
+    )
+    
+    return jsonify({
+        'responses': responses,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)
+    }), 200
+
+# Process-local counters (rate limit rejections, etc.)
+@api.route('/api/metrics', methods=['GET'])
+@token_required
+@admin_required
+def get_metrics(current_user):
+    return jsonify(metrics.snapshot()), 200
+
+# Start sampling this worker's stacks in the background. Only the worker
+# that receives the request is profiled (its pid is in the response); with
+# several gunicorn workers, repeat the request to cover others
+@api.route('/api/admin/profiles', methods=['POST'])
+@token_required
+@admin_required
+def start_profile(current_user):
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        seconds = float(data.get('seconds', 10))
+        hz = float(data.get('hz', current_app.config['PROFILER_DEFAULT_HZ']))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'seconds and hz must be numbers'}), 400
+    if not 0 < seconds <= current_app.config['PROFILER_MAX_SECONDS']:
+        return jsonify({'message': f"seconds must be between 0 and {current_app.config['PROFILER_MAX_SECONDS']}"}), 400
+    if not 0 < hz <= current_app.config['PROFILER_MAX_HZ']:
+        return jsonify({'message': f"hz must be between 0 and {current_app.config['PROFILER_MAX_HZ']}"}), 400
+    
+    try:
+        name = current_app.extensions['profiler'].start(seconds, hz)
+    except ProfilerBusy as e:
+        return jsonify({'message': str(e)}), 409
+    
+    # Results land in a shared directory, so any worker can serve them
+    return jsonify({
+        'profile': name,
+        'pid': os.getpid(),
+        'seconds': seconds,
+        'hz': hz,
+        'url': f'/api/admin/profiles/{name}'
+    }), 202
+
+# Download a finished profile as collapsed stacks (flamegraph.pl/speedscope)
+@api.route('/api/admin/profiles/<name>', methods=['GET'])
+@token_required
+@admin_required
+def get_profile(current_user, name):
+    path = current_app.extensions['profiler'].result_path(name)
+    if not path:
+        return jsonify({'message': 'Profile not found or still running'}), 404
+    
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
+
+# Slow statements aggregated by fingerprint, worst total time first
+@api.route('/api/admin/slow-queries', methods=['GET'])
+@token_required
+@admin_required
+def get_slow_queries(current_user):
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(current_app.extensions['slow_query_log'].summary(limit)), 200
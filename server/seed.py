@@ -1,11 +1,12 @@
 from faker import Faker
 from random import randint, choice, uniform
-from app import app           # ensure app.py exposes 'app'
+from app import create_app
 from models import db, User, Product, Order, OrderItem, ChatMessage
 
 fake = Faker()
 
 def run_seed():
+    app = create_app({'LOAD_MIGRATIONS': False})
     with app.app_context():
         db.drop_all()
         db.create_all()
@@ -21,6 +22,8 @@ def run_seed():
                 farm_name=fake.company(),
                 location=fake.city()
             )
+            # Spread farms around central Kenya for "near me" searches
+            farmer.set_coordinates(uniform(-1.5, 0.5), uniform(35.5, 37.5))
             farmer.set_password("password")
             farmers.append(farmer)
 
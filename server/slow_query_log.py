@@ -0,0 +1,238 @@
+# slow_query_log.py
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from metrics import metrics
+
+logger = logging.getLogger('smartfarm.slow_query')
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+# :name binds, but not the second colon of a ::type cast
+_PLACEHOLDER_RE = re.compile(r'%\([^)]+\)s|%s|\?|(?<!:):\w+|\$\d+')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_VALUES_RE = re.compile(r'(VALUES\s*\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+    """
+    Reduce a statement to its shape: literals and placeholders become ?,
+    IN lists and multi-row VALUES collapse, whitespace is squeezed
+    """
+    sql = _STRING_RE.sub('?', statement)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _LIST_RE.sub('(?, ...)', sql)
+    sql = _VALUES_RE.sub(r'\1, ...', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+
+def parameter_shape(parameters, executemany):
+    """
+    Describe bound parameters by type only, never by value
+    """
+    def shape(params):
+        if isinstance(params, dict):
+            return {key: type(value).__name__ for key, value in params.items()}
+        if isinstance(params, (list, tuple)):
+            return [type(value).__name__ for value in params]
+        return type(params).__name__
+
+    if executemany:
+        rows = list(parameters or [])
+        return {'rows': len(rows), 'row': shape(rows[0]) if rows else None}
+    return shape(parameters)
+
+
+class PerProcessFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler writing to the path with the pid before its extension
+    (slow_queries.<pid>.log), so gunicorn workers each rotate their own file;
+    rotating one file shared by several processes loses records. The file is
+    (re)opened on first use in each process, so a handler added in a
+    preloading master follows every worker's pid.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path = os.path.abspath(path)
+        self._pid = os.getpid()
+        super().__init__(self._pid_path(), delay=True, **kwargs)
+
+    def _pid_path(self):
+        root, ext = os.path.splitext(self.path)
+        return f'{root}.{os.getpid()}{ext}'
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self.acquire()
+            try:
+                if self._pid != os.getpid():
+                    # The inherited stream (if any) belongs to the parent
+                    self.stream = None
+                    self.baseFilename = self._pid_path()
+                    self._pid = os.getpid()
+            finally:
+                self.release()
+        super().emit(record)
+
+
+class SlowQueryLog:
+    """
+    Engine event hooks that record statements slower than
+    SLOW_QUERY_THRESHOLD_MS to a rotating JSON-lines log per process (see
+    PerProcessFileHandler) and aggregate them by fingerprint. On Postgres the
+    plan is captured with EXPLAIN, at most once per fingerprint every
+    SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+    """
+
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        if not app.config.get('SLOW_QUERY_LOG_ENABLED', True):
+            return
+
+        self.threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+        self.explain = app.config['SLOW_QUERY_EXPLAIN']
+        self.explain_interval = app.config['SLOW_QUERY_EXPLAIN_INTERVAL']
+
+        path = app.config['SLOW_QUERY_LOG_PATH']
+        if not any(getattr(h, 'path', None) == os.path.abspath(path) for h in logger.handlers):
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            handler = PerProcessFileHandler(
+                path,
+                maxBytes=app.config['SLOW_QUERY_LOG_MAX_BYTES'],
+                backupCount=app.config['SLOW_QUERY_LOG_BACKUPS']
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        with app.app_context():
+            for engine in db.engines.values():
+                self.watch(engine)
+
+    def watch(self, engine):
+        """
+        Time statements on another engine too, e.g. the async engine's
+        sync_engine
+        """
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+        event.listen(engine, 'handle_error', self._error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+    def _error(self, exception_context):
+        # A failed statement never reaches after_cursor_execute
+        conn = exception_context.connection
+        starts = conn.info.get('slow_query_start') if conn is not None else None
+        if starts:
+            starts.pop()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('slow_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold:
+            return
+
+        normalized = normalize_sql(statement)
+        key = fingerprint(normalized)
+        route = request.endpoint if has_request_context() else None
+        elapsed_ms = elapsed * 1000
+        now = time.time()
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'fingerprint': key, 'sql': normalized, 'count': 0,
+                    'total_ms': 0.0, 'max_ms': 0.0, 'routes': {}, 'plan': None,
+                    '_explained_at': 0.0
+                }
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            route_name = route or '<no request>'
+            stats['routes'][route_name] = stats['routes'].get(route_name, 0) + 1
+            should_explain = (
+                self.explain and conn.dialect.name == 'postgresql' and not executemany
+                and now - stats['_explained_at'] >= self.explain_interval
+            )
+            if should_explain:
+                stats['_explained_at'] = now
+
+        plan = self._explain(conn, statement, parameters) if should_explain else None
+        if plan is not None:
+            with self._lock:
+                stats['plan'] = plan
+
+        metrics.increment('slow_queries_total', route=route or '<no request>')
+        logger.info(json.dumps({
+            'ts': now,
+            'fingerprint': key,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'route': route,
+            'sql': normalized,
+            'params': parameter_shape(parameters, executemany),
+            'plan': plan
+        }, default=str))
+
+    def _explain(self, conn, statement, parameters):
+        # Run on the raw DBAPI connection so the EXPLAIN itself isn't timed
+        # or logged, inside a savepoint so a failure can't poison the
+        # caller's transaction
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT')):
+            return None
+        raw = conn.connection.dbapi_connection.cursor()
+        try:
+            raw.execute('SAVEPOINT slow_query_explain')
+            try:
+                raw.execute('EXPLAIN (ANALYZE off, FORMAT TEXT) ' + statement, parameters)
+                plan = '\n'.join(row[0] for row in raw.fetchall())
+                raw.execute('RELEASE SAVEPOINT slow_query_explain')
+                return plan
+            except Exception:
+                raw.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                return None
+        except Exception:
+            return None
+        finally:
+            raw.close()
+
+    def summary(self, limit=50):
+        """
+        Aggregated slow statements, worst total time first
+        """
+        with self._lock:
+            rows = [
+                {k: (dict(v) if isinstance(v, dict) else v) for k, v in stats.items() if not k.startswith('_')}
+                for stats in self._stats.values()
+            ]
+        for row in rows:
+            row['total_ms'] = round(row['total_ms'], 3)
+            row['max_ms'] = round(row['max_ms'], 3)
+            row['avg_ms'] = round(row['total_ms'] / row['count'], 3)
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows[:limit]
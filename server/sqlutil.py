@@ -0,0 +1,58 @@
+# sqlutil.py
+import string
+import sys
+
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql, sqlite
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def dialect_insert(dialect_name):
+    """
+    Return the insert() construct supporting ON CONFLICT for a dialect
+    """
+    if dialect_name == 'postgresql':
+        return postgresql.insert
+    if dialect_name == 'sqlite':
+        return sqlite.insert
+    raise NotImplementedError(f'Upserts are not supported on {dialect_name}')
+
+
+def fold_case(value, dialect_name):
+    """
+    Lowercase value the way the database's lower() does, so it can be
+    compared with lower(column). SQLite's lower() only folds ASCII letters.
+    """
+    if dialect_name == 'sqlite':
+        return value.translate(_ASCII_LOWER)
+    return value.lower()
+
+
+def _successor(prefix):
+    # The smallest string greater than every string starting with prefix, or
+    # None if there is none. Trailing U+10FFFF can't be incremented, and
+    # surrogates can't be encoded, so those are skipped
+    while prefix:
+        code_point = ord(prefix[-1]) + 1
+        if code_point <= sys.maxunicode:
+            if 0xD800 <= code_point <= 0xDFFF:
+                code_point = 0xE000
+            return prefix[:-1] + chr(code_point)
+        prefix = prefix[:-1]
+    return None
+
+
+def prefix_match(expression, prefix, dialect_name):
+    """
+    Index-friendly "expression starts with prefix". Postgres uses LIKE, which
+    a text_pattern_ops index serves under any collation; elsewhere a
+    half-open range works on a plain index since comparisons are bytewise
+    """
+    if dialect_name == 'postgresql':
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return expression.like(escaped + '%', escape='\\')
+    successor = _successor(prefix)
+    if successor is None:
+        return expression >= prefix
+    return and_(expression >= prefix, expression < successor)
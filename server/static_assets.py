@@ -0,0 +1,109 @@
+# static_assets.py
+import mimetypes
+import os
+import re
+
+import click
+from flask import Blueprint, abort, current_app, request, send_file
+from flask.cli import with_appcontext
+
+from compression import COMPRESSIBLE_MIMETYPES, brotli, compress
+
+# Create React App puts an 8-hex content hash in the names of built assets
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{8}\.')
+PRECOMPRESS_MIN_SIZE = 1024
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+frontend = Blueprint('frontend', __name__)
+
+
+def _is_compressible(path):
+    mimetype = mimetypes.guess_type(path)[0]
+    return mimetype in COMPRESSIBLE_MIMETYPES or path.endswith(('.map', '.json', '.txt', '.ico'))
+
+
+def precompress_directory(root):
+    """
+    Write maximum-effort .br and .gz siblings for every compressible file
+    under root, skipping ones that are already up to date. Returns the
+    number of files written.
+    """
+    written = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.endswith(tuple(ENCODING_SUFFIXES.values())):
+                continue
+            path = os.path.join(directory, name)
+            if os.path.getsize(path) < PRECOMPRESS_MIN_SIZE or not _is_compressible(path):
+                continue
+
+            with open(path, 'rb') as f:
+                data = None
+                for encoding, suffix in ENCODING_SUFFIXES.items():
+                    if encoding == 'br' and brotli is None:
+                        continue
+                    target = path + suffix
+                    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                        continue
+                    data = data if data is not None else f.read()
+                    # Build time, so spend the CPU on the smallest output
+                    compressed = compress(data, encoding, gzip_level=9, brotli_quality=11)
+                    if len(compressed) >= len(data):
+                        continue
+                    with open(target, 'wb') as out:
+                        out.write(compressed)
+                    written += 1
+    return written
+
+
+def _send_asset(filename, immutable):
+    root = current_app.config['CLIENT_BUILD_DIR']
+    path = os.path.realpath(os.path.join(root, filename))
+    if not path.startswith(os.path.realpath(root) + os.sep) or not os.path.isfile(path):
+        abort(404)
+
+    # The hashed name changes whenever the content does, so those files can
+    # be cached forever; everything else is revalidated
+    max_age = current_app.config['STATIC_CACHE_MAX_AGE'] if immutable else None
+
+    response = None
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        variant = path + suffix
+        if request.accept_encodings[encoding] and os.path.isfile(variant):
+            mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = send_file(variant, mimetype=mimetype, max_age=max_age)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_file(path, max_age=max_age)
+    response.vary.add('Accept-Encoding')
+
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+@frontend.route('/static/<path:filename>')
+def static_asset(filename):
+    return _send_asset(os.path.join('static', filename), bool(HASHED_NAME_RE.search(filename)))
+
+
+@frontend.route('/', defaults={'path': ''})
+@frontend.route('/<path:path>')
+def index(path):
+    if path.startswith('api/'):
+        abort(404)
+    # Top-level build files (favicon, manifest, ...) or the SPA shell for
+    # client-side routes
+    root = current_app.config['CLIENT_BUILD_DIR']
+    if path and os.path.isfile(os.path.join(root, path)):
+        return _send_asset(path, False)
+    return _send_asset('index.html', False)
+
+
+@click.command('precompress-assets')
+@with_appcontext
+def precompress_assets_command():
+    """Write .br/.gz copies of the built client assets."""
+    written = precompress_directory(current_app.config['CLIENT_BUILD_DIR'])
+    click.echo(f'Wrote {written} precompressed files')
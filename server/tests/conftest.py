@@ -0,0 +1,63 @@
+# conftest.py
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from models import db, User, Product
+
+
+@pytest.fixture
+def app_config():
+    # Overridden by test modules that need other settings
+    return {'RATELIMIT_ENABLED': False}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """
+    The app on a fresh schema: a temporary SQLite file, or the database at
+    TEST_DATABASE_URL (whose tables are dropped afterwards).
+    """
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', f"sqlite:///{tmp_path / 'test.db'}"),
+        'LOAD_MIGRATIONS': False,
+        **app_config,
+    })
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def farmer(app):
+    user = User(username='farmer', email='farmer@example.com', user_type='farmer', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def make_product(farmer):
+    def make_product(name='Maize', quantity=10):
+        product = Product(name=name, price=50, category='Grains', quantity=quantity, farmer_id=farmer.id)
+        db.session.add(product)
+        db.session.commit()
+        return product
+    return make_product
+
+
+@pytest.fixture
+def make_buyer(app):
+    def make_buyer(username='buyer'):
+        user = User(username=username, email=f'{username}@example.com', user_type='buyer', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_buyer
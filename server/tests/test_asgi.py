@@ -0,0 +1,124 @@
+# test_asgi.py
+import asyncio
+import gzip
+import json
+import threading
+from datetime import datetime, timedelta
+
+import jwt
+import pytest
+
+from app import create_app
+from asgi_app import AsgiApp
+from models import db, ChatMessage, Order, OrderItem, User
+
+
+async def _get(asgi, path, headers=()):
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+        'headers': [(name.encode(), value.encode()) for name, value in headers]
+    }
+    await asgi(scope, receive, send)
+    start = messages[0]
+    body = b''.join(message.get('body', b'') for message in messages[1:])
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+
+def _serve(app, *requests):
+    # One event loop for every request, as the async engine is bound to it
+    async def run():
+        asgi = AsgiApp(app)
+        try:
+            return [await _get(asgi, *request) for request in requests]
+        finally:
+            await asgi.async_db.dispose()
+    return asyncio.run(run())
+
+
+def _auth(app, user):
+    token = jwt.encode(
+        {'user_id': user.id, 'exp': datetime.utcnow() + timedelta(hours=1)}, app.config['SECRET_KEY']
+    )
+    return ('Authorization', f'Bearer {token}')
+
+
+def test_chat_users_match_the_wsgi_view(app, make_product, make_buyer):
+    farmer_product = make_product()
+    ordered, messaged = make_buyer('ordered'), make_buyer('messaged')
+    admin = User(username='admin', email='admin@example.com', user_type='admin', password_hash='x')
+    db.session.add(admin)
+    order = Order(buyer_id=ordered.id, total_amount=50, phone_number='254700000000')
+    order.items.append(OrderItem(product_id=farmer_product.id, quantity=1, price=50))
+    db.session.add(order)
+    for sender in (messaged, admin, ordered):
+        db.session.add(ChatMessage(sender_id=sender.id, receiver_id=farmer_product.farmer_id, message='hi'))
+    db.session.commit()
+
+    farmer = db.session.get(User, farmer_product.farmer_id)
+    expected = app.test_client().get('/api/chat/users', headers=[_auth(app, farmer)]).get_json()
+    (status, _, body), = _serve(app, ('/api/chat/users', [_auth(app, farmer)]))
+
+    assert status == 200
+    assert sorted(user['username'] for user in expected) == ['messaged', 'ordered']
+    assert sorted(json.loads(body), key=lambda u: u['id']) == sorted(expected, key=lambda u: u['id'])
+
+
+def _record_threads(monkeypatch, obj, name, threads):
+    original = getattr(obj, name)
+
+    def recorded(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(obj, name, recorded)
+
+
+def test_async_view_responses_are_compressed_off_the_loop(app, make_product, monkeypatch):
+    for i in range(40):
+        make_product(f'Product {i}')
+    threads = []
+    _record_threads(monkeypatch, app.extensions['compressor'], 'compress_response', threads)
+
+    (status, headers, body), = _serve(app, ('/api/products', [('Accept-Encoding', 'gzip')]))
+
+    assert status == 200
+    assert len(threads) == 1 and threads[0].startswith('asgi-wsgi')
+    assert headers['content-encoding'] == 'gzip'
+    assert 'Accept-Encoding' in headers['vary']
+    assert gzip.decompress(body) == app.test_client().get('/api/products').get_data()
+
+
+class TestRateLimits:
+    @pytest.fixture
+    def app_config(self, tmp_path):
+        return {
+            'RATELIMIT_ENABLED': True,
+            'RATELIMIT_STORAGE': 'mmap',
+            'RATELIMIT_MMAP_PATH': str(tmp_path / 'ratelimit.bin'),
+            'RATELIMIT_MMAP_SLOTS': 1024,
+            'RATELIMIT_LIMITS': {'api.get_products': {'client': (2, 0.001)}},
+        }
+
+    def test_async_views_are_rate_limited_off_the_loop(self, app, monkeypatch):
+        threads = []
+        _record_threads(monkeypatch, app.extensions['ratelimiter'].store, 'acquire', threads)
+
+        responses = _serve(app, *[('/api/products',)] * 3)
+
+        assert [status for status, _, _ in responses] == [200, 200, 429]
+        assert 'retry-after' in responses[2][1]
+        # Checked once per request, in the thread pool
+        assert len(threads) == 3 and all(name.startswith('asgi-wsgi') for name in threads)
+
+
+def test_in_memory_sqlite_is_refused():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'LOAD_MIGRATIONS': False})
+    with pytest.raises(ValueError):
+        AsgiApp(app)
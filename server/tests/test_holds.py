@@ -0,0 +1,105 @@
+# test_holds.py
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from holds import InsufficientStock, _unreserve, checkout, set_hold
+from models import db, InventoryHold, Product
+
+
+def _product_updates(engine, product_ids):
+    # Records the product id of every UPDATE product, whatever the driver's
+    # parameter style
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('UPDATE PRODUCT'):
+            product_ids.append(context.compiled_parameters[0]['id_1'])
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    return before_cursor_execute
+
+
+def test_hold_cannot_reserve_more_than_available(make_product, make_buyer):
+    product = make_product(quantity=5)
+    first, second = make_buyer('first'), make_buyer('second')
+
+    set_hold(first.id, product.id, 3, ttl=600)
+    db.session.commit()
+    with pytest.raises(InsufficientStock) as excinfo:
+        set_hold(second.id, product.id, 3, ttl=600)
+    db.session.rollback()
+
+    assert excinfo.value.available == 2
+    assert db.session.get(Product, product.id).reserved_quantity == 3
+
+
+def test_checkout_refuses_stock_lowered_after_hold(make_product, make_buyer):
+    product = make_product(quantity=5)
+    buyer = make_buyer()
+    set_hold(buyer.id, product.id, 4, ttl=600)
+    db.session.commit()
+
+    # The farmer lowers the stock below what is held
+    db.session.get(Product, product.id).quantity = 3
+    db.session.commit()
+
+    with pytest.raises(InsufficientStock):
+        checkout(buyer.id, '254700000000')
+    db.session.rollback()
+
+    product = db.session.get(Product, product.id)
+    assert (product.quantity, product.reserved_quantity) == (3, 4)
+    assert db.session.query(InventoryHold).count() == 1
+
+
+def test_checkout_moves_held_stock_to_sold(make_product, make_buyer):
+    product = make_product(quantity=5)
+    buyer = make_buyer()
+    set_hold(buyer.id, product.id, 4, ttl=600)
+    db.session.commit()
+
+    order, expired = checkout(buyer.id, '254700000000')
+    db.session.commit()
+
+    product = db.session.get(Product, product.id)
+    assert (product.quantity, product.reserved_quantity) == (1, 0)
+    assert [(item.product_id, item.quantity) for item in order.items] == [(product.id, 4)]
+    assert expired == []
+
+
+def test_sweep_releases_only_lapsed_holds(app, make_product, make_buyer):
+    products = [make_product(f'Product {i}', quantity=10) for i in range(3)]
+    lapsed, live = make_buyer('lapsed'), make_buyer('live')
+    for product in products:
+        set_hold(lapsed.id, product.id, 2, ttl=600)
+        set_hold(live.id, product.id, 1, ttl=600)
+    db.session.commit()
+    db.session.query(InventoryHold).filter_by(user_id=lapsed.id).update(
+        {'expires_at': datetime.utcnow() - timedelta(seconds=1)}
+    )
+    db.session.commit()
+
+    app.extensions['hold_sweeper'].sweep()
+
+    db.session.expire_all()
+    assert [p.reserved_quantity for p in db.session.query(Product).order_by(Product.id)] == [1, 1, 1]
+    assert {hold.user_id for hold in db.session.query(InventoryHold)} == {live.id}
+
+
+def test_unreserve_updates_products_in_id_order(make_product):
+    products = [make_product(f'Product {i}') for i in range(3)]
+    ids = [product.id for product in products]
+    for product in products:
+        product.reserved_quantity = 5
+    db.session.commit()
+
+    updated = []
+    listener = _product_updates(db.engine, updated)
+    try:
+        # Rows as a sweep might return them, out of id order and repeated
+        _unreserve([(ids[2], 1), (ids[0], 1), (ids[1], 1), (ids[2], 1)])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    db.session.commit()
+
+    assert updated == ids
+    assert [p.reserved_quantity for p in db.session.query(Product).order_by(Product.id)] == [4, 4, 3]
@@ -0,0 +1,91 @@
+# test_outbox.py
+import json
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+from models import db, OutboxEvent
+from outbox import ORDER_STATUS_CHANGED, SINKS, OutboxDispatcher
+
+
+class RecordingSink:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+
+    def send(self, notifications):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('sink unavailable')
+        self.batches.append(notifications)
+
+
+@pytest.fixture
+def sinks(app, monkeypatch):
+    sinks = {'steady': RecordingSink(), 'flaky': RecordingSink(failures=1)}
+    for name, sink in sinks.items():
+        monkeypatch.setitem(SINKS, name, lambda config, sink=sink: sink)
+    app.config['OUTBOX_SINKS'] = list(sinks)
+    return sinks
+
+
+def _add_event(order_id, status, attempts=0):
+    event = OutboxEvent(
+        topic=ORDER_STATUS_CHANGED, aggregate_id=order_id, attempts=attempts,
+        payload=json.dumps({'order_id': order_id, 'status': status, 'previous_status': 'pending'})
+    )
+    db.session.add(event)
+    db.session.commit()
+    return event.id
+
+
+def _make_due():
+    OutboxEvent.query.update({'available_at': datetime.utcnow()})
+    db.session.commit()
+
+
+def test_retry_only_goes_to_the_sinks_that_failed(app, sinks):
+    dispatcher = OutboxDispatcher(app)
+    event_id = _add_event(1, 'confirmed')
+
+    assert dispatcher.dispatch_once() == (1, 0)
+    event = db.session.get(OutboxEvent, event_id)
+    assert (event.attempts, event.delivered_sinks) == (1, 'steady')
+
+    _make_due()
+    assert dispatcher.dispatch_once() == (1, 1)
+    assert [len(batch) for batch in sinks['steady'].batches] == [1]
+    assert [len(batch) for batch in sinks['flaky'].batches] == [1]
+    assert OutboxEvent.query.count() == 0
+
+
+def test_attempts_are_counted_per_event(app, sinks):
+    app.config['OUTBOX_MAX_ATTEMPTS'] = 3
+    dispatcher = OutboxDispatcher(app)
+    worn = _add_event(1, 'confirmed', attempts=2)
+    fresh = _add_event(2, 'confirmed')
+
+    dispatcher.dispatch_once()
+
+    worn, fresh = db.session.get(OutboxEvent, worn), db.session.get(OutboxEvent, fresh)
+    assert worn.attempts == 3 and worn.failed_at is not None
+    assert fresh.attempts == 1 and fresh.failed_at is None
+
+
+def test_one_process_holds_the_poll_lock(app, tmp_path):
+    app.config['OUTBOX_POLL_LOCK_PATH'] = str(tmp_path / 'outbox_poll.lock')
+    dispatcher = OutboxDispatcher(app)
+    assert dispatcher._holds_poll_lock()
+
+    # Record locks are per process, so another process is turned away
+    other = subprocess.run([sys.executable, '-c', (
+        'import fcntl, os, sys\n'
+        'fd = os.open(sys.argv[1], os.O_RDWR)\n'
+        'try:\n'
+        '    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)\n'
+        'except OSError:\n'
+        '    sys.exit(1)\n'
+    ), app.config['OUTBOX_POLL_LOCK_PATH']])
+    assert other.returncode == 1
@@ -0,0 +1,96 @@
+# test_partitions.py
+from datetime import datetime
+
+import pytest
+
+from models import db, Order, OrderItem
+from partitions import archive_month, archive_parts, archive_path, restore_month
+
+MONTH = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def archive_dir(app, tmp_path):
+    app.config['ARCHIVE_DIR'] = str(tmp_path / 'archive')
+    return tmp_path / 'archive'
+
+
+def _add_order(buyer, product, day, month=1):
+    order = Order(
+        buyer_id=buyer.id, total_amount=100, phone_number='254700000000', status='pending',
+        created_at=datetime(2024, month, day)
+    )
+    order.items.append(OrderItem(product_id=product.id, quantity=2, price=50))
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+def _month_orders():
+    return sorted(
+        (order.id, order.status, [(item.product_id, item.quantity) for item in order.items])
+        for order in Order.query.filter(Order.created_at >= MONTH, Order.created_at < datetime(2024, 2, 1))
+    )
+
+
+def test_late_rows_are_archived_to_a_new_part(archive_dir, make_product, make_buyer):
+    buyer, product = make_buyer(), make_product()
+    _add_order(buyer, product, 3)
+    _add_order(buyer, product, 10)
+    _add_order(buyer, product, 1, month=2)
+    expected = _month_orders()
+    assert archive_month('order', MONTH) == 2
+    db.session.commit()
+
+    # An order for the month arrives after it was archived
+    late = _add_order(buyer, product, 20)
+    expected.append((late, 'pending', [(product.id, 2)]))
+    assert archive_month('order', MONTH) == 1
+    db.session.commit()
+    assert archive_parts('order', MONTH) == [archive_path('order', MONTH), archive_path('order', MONTH, 2)]
+    assert _month_orders() == []
+
+    assert restore_month('order', MONTH) == 3
+    db.session.commit()
+    db.session.expire_all()
+    assert _month_orders() == expected
+    assert OrderItem.query.count() == 4
+
+
+def test_rows_archived_twice_are_restored_once(archive_dir, make_product, make_buyer):
+    buyer, product = make_buyer(), make_product()
+    _add_order(buyer, product, 3)
+    expected = _month_orders()
+    archive_month('order', MONTH)
+    # The archive's transaction fails after its files were written
+    db.session.rollback()
+    assert archive_month('order', MONTH) == 1
+    db.session.commit()
+    assert len(archive_parts('order', MONTH)) == 2
+
+    assert restore_month('order', MONTH) == 1
+    db.session.commit()
+    assert _month_orders() == expected
+
+
+def test_rearchiving_a_restored_month_replaces_the_archive(archive_dir, make_product, make_buyer):
+    buyer, product = make_buyer(), make_product()
+    kept = _add_order(buyer, product, 3)
+    deleted = _add_order(buyer, product, 10)
+    archive_month('order', MONTH)
+    db.session.commit()
+    restore_month('order', MONTH)
+    db.session.commit()
+
+    # Changes made while the month was restored are what gets archived
+    db.session.get(Order, kept).status = 'delivered'
+    OrderItem.query.filter_by(order_id=deleted).delete()
+    db.session.delete(db.session.get(Order, deleted))
+    db.session.commit()
+    assert archive_month('order', MONTH) == 1
+    db.session.commit()
+    assert archive_parts('order', MONTH) == [archive_path('order', MONTH)]
+
+    assert restore_month('order', MONTH) == 1
+    db.session.commit()
+    assert _month_orders() == [(kept, 'delivered', [(product.id, 2)])]